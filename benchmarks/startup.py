@@ -0,0 +1,102 @@
+"""
+Startup time benchmark of `tcal`
+
+Runs `tcal` without arguments under ``python -X importtime``,
+and fails if the import time of tinycal and its dependencies exceeds the budget,
+or if a module that should be deferred is imported.
+
+Usage::
+
+    $ python benchmarks/startup.py [--budget MILLISECONDS] [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that a plain `tcal` should never import
+DEFERRED_MODULES = ('argparse', 'configparser', 'calendar', 'json', 'hashlib', 'mmap', 're', 'unicodedata',
+                    'tinycal.marks')
+
+SCRIPT = 'from tinycal.__main__ import main; main([])'
+
+
+def parse_importtime(stderr):
+    r"""
+    Return {module: cumulative microseconds} of the top-level imports
+
+    >>> parse_importtime('import time: self [us] | cumulative | imported package\n'
+    ...                  'import time:       100 |        100 |   os\n'
+    ...                  'import time:       200 |        300 | tinycal')
+    {'tinycal': 300}
+    """
+    ret = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+
+        # Nested imports are indented by two more spaces
+        name = fields[2].rstrip()
+        if not name.startswith('  '):
+            ret[name.strip()] = int(fields[1])
+
+    return ret
+
+
+def measure(python, script, home):
+    env = dict(os.environ, HOME=home, PYTHONPATH=ROOT)
+    env.pop('TINYCAL_CACHE', None)
+    proc = subprocess.run(
+            [python, '-X', 'importtime', '-c', script + '; import sys; print(*sorted(sys.modules), file=sys.stderr)'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    lines = proc.stderr.splitlines()
+    imports = parse_importtime('\n'.join(lines[:-1]))
+    return imports, set(lines[-1].split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time benchmark of tcal')
+    parser.add_argument('--budget', type=float, default=40.0,
+                        help='Import time budget in milliseconds (default: 40)')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs, the median is compared with the budget (default: 5)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Warm up, compile .pyc files
+        measure(sys.executable, SCRIPT, home)
+
+        baseline = []
+        totals = []
+        for i in range(args.runs):
+            imports, _ = measure(sys.executable, 'pass', home)
+            baseline.append(sum(imports.values()))
+
+            imports, modules = measure(sys.executable, SCRIPT, home)
+            totals.append(sum(imports.values()))
+
+    elapsed = (statistics.median(totals) - statistics.median(baseline)) / 1000
+    deferred = sorted(m for m in DEFERRED_MODULES if m in modules)
+
+    print('import time: {:.1f} ms (budget: {:.1f} ms)'.format(elapsed, args.budget))
+    if deferred:
+        print('modules that should be deferred: {}'.format(', '.join(deferred)))
+
+    if elapsed > args.budget or deferred:
+        print('FAIL')
+        sys.exit(1)
+
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""
+Benchmark suite of tinycal
+
+Measures the wall time, the allocation peak (``tracemalloc``) and the output size
+of end-to-end `tcal` runs and of the individual stages,
+and compares them with a stored baseline.
+
+Usage::
+
+    $ python benchmarks/suite.py --save baseline.json
+    $ python benchmarks/suite.py --baseline baseline.json [--threshold 0.25]
+    $ python benchmarks/suite.py --filter marks --runs 10
+
+Fails if the time or the allocation peak of a scenario exceeds the baseline by more than the threshold,
+small absolute differences (1 ms, 4 KiB) are ignored as noise.
+"""
+
+import argparse
+import fnmatch
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from contextlib import redirect_stdout
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tinycal import tcal
+from tinycal.config import Color, TinyCalConfig
+from tinycal.marks import MarksIndex
+from tinycal.render import TinyCalRenderer
+
+TODAY = '--today=2020/03/14'
+
+CALRC = '''
+col = 3
+after = 1
+before = 1
+wk = true
+fill = true
+border = full
+border.style = single
+border.weld = true
+border.color = none:none
+title.color = BLACK:cyan
+wk.color = black:white
+today.color = black:white
+weekday.color = YELLOW
+sunday.color = red
+saturday.color = green
+fill.color = BLACK
+'''
+
+
+def marks_lines(count):
+    colors = ('red', 'GREEN', 'blue:white', 'YELLOW:red', 'none:cyan')
+    first = date(2000, 1, 1).toordinal()
+    return ['{} {}'.format(date.fromordinal(first + i * 3).strftime('%Y/%m/%d'), colors[i % len(colors)])
+            for i in range(count)]
+
+
+# Colored borders, the worst case of redundant SGR sequences
+COLORED_BORDER_CALRC = CALRC.replace('border.color = none:none', 'border.color = cyan')
+
+SGR_SUFFIX = '/sgr-coalesce'
+
+
+def tcal_main(argv, calrc=CALRC):
+    r"""
+    Return a scenario that runs `tcal` with ``argv`` and returns its output
+    """
+    def setup(workdir):
+        def run():
+            tcal.CALRCS = [io.StringIO(calrc)]
+            out = io.StringIO()
+            with redirect_stdout(out):
+                tcal.main(argv)
+
+            return out.getvalue()
+
+        return run
+
+    return setup
+
+
+def tcal_main_with_marks(count, argv):
+    def setup(workdir):
+        path = os.path.join(workdir, 'marks{}'.format(count))
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write('\n'.join(marks_lines(count)) + '\n')
+
+        return tcal_main(['--marks', path] + argv)(workdir)
+
+    return setup
+
+
+def stage_parse_conf(workdir):
+    return lambda: TinyCalConfig.parse_conf([io.StringIO(CALRC)])
+
+
+def stage_parse_marks(count):
+    def setup(workdir):
+        lines = marks_lines(count)
+        return lambda: MarksIndex.parse(lines)
+
+    return setup
+
+
+def stage_color(workdir):
+    colors = [Color(c) for c in ('red', 'GREEN', 'blue:white', 'YELLOW:red', 'none:cyan', '')]
+    days = ['{:>2}'.format(d) for d in range(1, 32)] * 100
+    return lambda: ''.join(c(d) for c in colors for d in days)
+
+
+def stage_build_cells(workdir):
+    conf = TinyCalConfig.parse_conf([io.StringIO(CALRC)])
+    months = tcal.month_range(date(2020, 1, 1), date(2020, 12, 1))
+    return lambda: tcal.build_cells(conf, months, today=date(2020, 3, 14))
+
+
+def stage_render(workdir):
+    conf = TinyCalConfig.parse_conf([io.StringIO(CALRC)])
+    cells = tcal.build_cells(conf, tcal.month_range(date(2020, 1, 1), date(2020, 12, 1)), today=date(2020, 3, 14))
+    return lambda: TinyCalRenderer(conf, cells).render()
+
+
+SCENARIOS = [
+        ('main/1-month', tcal_main(['--color=always', TODAY, '-A', '0', '-B', '0'])),
+        ('main/3-months', tcal_main(['--color=always', TODAY, '-3'])),
+        ('main/year', tcal_main(['--color=always', TODAY, '2020'])),
+        ('main/100-years', tcal_main(['--color=always', TODAY, '1920/01..2019/12'])),
+        ('main/cont', tcal_main(['--color=always', TODAY, '--cont', '2020'])),
+        ('main/no-color', tcal_main(['--color=never', TODAY, '2020'])),
+        ('main/json', tcal_main(['--format=json', TODAY, '2020'])),
+        ('main/colored-border', tcal_main(['--color=always', TODAY, '2020'], COLORED_BORDER_CALRC)),
+        ('main/colored-border' + SGR_SUFFIX,
+            tcal_main(['--color=always', '--sgr-coalesce', TODAY, '2020'], COLORED_BORDER_CALRC)),
+        ('main/100-years' + SGR_SUFFIX, tcal_main(['--color=always', '--sgr-coalesce', TODAY, '1920/01..2019/12'])),
+        ('main/100-years/numpy', tcal_main(['--color=always', TODAY, '1920/01..2019/12'], CALRC + 'engine = numpy\n')),
+        ] + [
+        ('main/border-{}'.format(style), tcal_main(['--color=always', TODAY, '--border=' + style, '2020']))
+        for style in ('ascii', 'single', 'bold', 'double', 'noweld', 'basic', 'off')
+        ] + [
+        ('main/lang-zh', tcal_main(['--color=always', TODAY, '-l', 'zh', '2020'])),
+        ('main/lang-jp', tcal_main(['--color=always', TODAY, '-l', 'jp', '--cont', '2020'])),
+        ('main/marks-10k', tcal_main_with_marks(10000, ['--color=always', TODAY, '2020'])),
+        ('main/marks-100k', tcal_main_with_marks(100000, ['--color=always', TODAY, '2020'])),
+        ('stage/parse-conf', stage_parse_conf),
+        ('stage/parse-marks-10k', stage_parse_marks(10000)),
+        ('stage/parse-marks-100k', stage_parse_marks(100000)),
+        ('stage/color', stage_color),
+        ('stage/build-cells', stage_build_cells),
+        ('stage/render', stage_render),
+        ]
+
+
+# Optional dependencies of the scenarios, the scenarios are skipped without them
+REQUIRES = {
+        'main/100-years/numpy': 'numpy',
+        }
+
+
+def missing_requirement(name):
+    r"""
+    Return the optional dependency of scenario ``name`` that is not installed, or None
+
+    >>> missing_requirement('main/1-month') is None
+    True
+    """
+    from importlib.util import find_spec
+
+    module = REQUIRES.get(name)
+    return module if module and find_spec(module) is None else None
+
+
+def output_bytes(output):
+    if isinstance(output, str):
+        return len(output.encode('utf-8'))
+
+    return None
+
+
+def measure(setup, workdir, runs):
+    r"""
+    Return {'seconds': median wall time, 'peak': allocation peak in bytes, 'bytes': output size}
+    """
+    run = setup(workdir)
+
+    # Warm up
+    output = run()
+
+    times = []
+    for i in range(runs):
+        t = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': statistics.median(times), 'peak': peak, 'bytes': output_bytes(output)}
+
+
+# Differences below these are treated as noise
+NOISE = {'seconds': 0.001, 'peak': 4096}
+
+
+def compare(results, baseline, threshold):
+    r"""
+    Return the list of regressions, as (scenario, metric, baseline value, value)
+
+    >>> compare({'a': {'seconds': 1.3, 'peak': 100, 'bytes': 10}, 'c': {'seconds': 0.0002, 'peak': 0}},
+    ...         {'a': {'seconds': 1.0, 'peak': 100, 'bytes': 20}, 'c': {'seconds': 0.0001, 'peak': 0}}, 0.25)
+    [('a', 'seconds', 1.0, 1.3)]
+    """
+    ret = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        for metric in ('seconds', 'peak'):
+            base = baseline[name].get(metric)
+            if base and result[metric] > base * (1 + threshold) and result[metric] - base > NOISE[metric]:
+                ret.append((name, metric, base, result[metric]))
+
+    return ret
+
+
+def sgr_savings(results):
+    r"""
+    Return (scenario, bytes, coalesced bytes) of the scenarios measured with and without SGR coalescing
+
+    >>> sgr_savings({'a': {'bytes': 100}, 'a/sgr-coalesce': {'bytes': 80}, 'b': {'bytes': 1}})
+    [('a', 100, 80)]
+    """
+    return [(name[:-len(SGR_SUFFIX)], results[name[:-len(SGR_SUFFIX)]]['bytes'], result['bytes'])
+            for name, result in results.items()
+            if name.endswith(SGR_SUFFIX) and name[:-len(SGR_SUFFIX)] in results]
+
+
+def ratio(value, base):
+    if not base or value is None:
+        return ''
+
+    return '{:+.0%}'.format(value / base - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite of tinycal')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs per scenario, the median is reported (default: 5)')
+    parser.add_argument('--filter', default='*',
+                        help='Only run the scenarios matching the glob pattern, or containing the string')
+    parser.add_argument('--save', metavar='FILE',
+                        help='Save the results as the baseline')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare the results with the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed ratio of regression over the baseline (default: 0.25)')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the date marking indices away from the user cache
+        os.environ['XDG_CACHE_HOME'] = workdir
+
+        print('{:<34} {:>10} {:>6} {:>10} {:>6} {:>10} {:>6}'.format(
+            'scenario', 'time (ms)', '', 'peak (KiB)', '', 'bytes', ''))
+        for name, setup in SCENARIOS:
+            if not fnmatch.fnmatch(name, args.filter) and args.filter not in name:
+                continue
+
+            missing = missing_requirement(name)
+            if missing:
+                print('{:<34} skipped: {} is not installed'.format(name, missing))
+                continue
+
+            result = results[name] = measure(setup, workdir, args.runs)
+            base = baseline.get(name, {})
+            print('{:<34} {:>10.2f} {:>6} {:>10.1f} {:>6} {:>10} {:>6}'.format(
+                name,
+                result['seconds'] * 1000, ratio(result['seconds'], base.get('seconds')),
+                result['peak'] / 1024, ratio(result['peak'], base.get('peak')),
+                '-' if result['bytes'] is None else result['bytes'], ratio(result['bytes'], base.get('bytes'))))
+
+    for name, size, coalesced in sgr_savings(results):
+        print('sgr coalescing: {} {} -> {} bytes ({})'.format(name, size, coalesced, ratio(coalesced, size)))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'runs': args.runs, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, base, value in regressions:
+        print('regression: {} {} {:.6g} -> {:.6g} ({})'.format(name, metric, base, value, ratio(value, base)))
+
+    if regressions:
+        print('FAIL')
+        sys.exit(1)
+
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+"""
+pytest configuration
+
+The NumPy engine is optional, its module is not collected (e.g. by ``--doctest-modules``) without NumPy.
+"""
+
+from importlib.util import find_spec
+
+collect_ignore = [] if find_spec('numpy') else ['tinycal/vectorized.py']
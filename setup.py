@@ -10,7 +10,10 @@ setup(
     author_email='michael66230@gmail.com',
     packages=['tinycal'],
     entry_points = {
-        'console_scripts': ['tcal=tinycal.tcal:main'],
+        'console_scripts': [
+            'tcal=tinycal.__main__:main',
+            'tcal-client=tinycal.client:main',
+            ],
     },
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -191,6 +191,44 @@ class ContiguousModeTestcase(TinyCalTestCase):
         stdout = self.run_with_args(['--today=2019/12/31', '-3', '--cont'])
         self.check_output('cont 20191231', stdout)
 
+    def test_date_span(self):
+        lines = self.run_with_args(['--no-fill', '2020/03/10..2020/04/02']).getvalue().splitlines()
+        self.assertIn('2020/03 ~ 2020/04', lines[1])
+        self.assertIn('│ 11 │       10 11 12 13 14 │ Mar │', lines)
+        self.assertIn('│ 14 │ 29 30 31  1  2       │ Apr │', lines)
+        self.assertEqual(len(lines), 4 + 4 + 1)
+
+    def test_weeks(self):
+        lines = self.run_with_args(['--weeks', '3', '-m']).getvalue().splitlines()
+        self.assertIn('│ 11 │  9 10 11 12 13 14 15 │', lines[4])
+        self.assertEqual(len(lines), 4 + 3 + 1)
+
+    def test_weeks_normalized_month(self):
+        lines = self.run_with_args(['--weeks', '2', '-m', '2020', '13']).getvalue().splitlines()
+        self.assertIn('│ 53 │ 28 29 30 31  1  2  3 │ Jan │', lines)
+        self.assertEqual(len(lines), 4 + 2 + 1)
+
+    def test_weeks_with_date_span(self):
+        with patch('sys.stderr', new_callable=StringIO) as stderr, self.assertRaises(SystemExit):
+            self.run_with_args(['--weeks', '3', '2020/03/10..2020/04/02'])
+
+        self.assertIn('--weeks cannot be specified with a date range', stderr.getvalue())
+
+    def test_weeks_match_monthly_layout(self):
+        from tinycal.layout import iter_weeks, layout
+
+        # Every week once, with the same days and week numbers as the months
+        months = tuple(tcal.month_range(datetime.date(1999, 1, 1), datetime.date(2030, 12, 1)))
+        for firstweekday in (tcal.MONDAY, tcal.SUNDAY):
+            weeks = list(iter_weeks(firstweekday, months[0].toordinal(), datetime.date(2030, 12, 31).toordinal()))
+            self.assertEqual(len(set(week.first for week in weeks)), len(weeks))
+            for block in layout(firstweekday, months):
+                for week in block.weeks:
+                    if week.row.in_range[-1] and week.first >= weeks[0].first:
+                        cont_week = weeks[(week.first - weeks[0].first) // 7]
+                        self.assertEqual((cont_week.first, cont_week.row.days, cont_week.wk),
+                                         (week.first, week.row.days, week.wk))
+
 
 class WeldTestcase(TinyCalTestCase):
     @property
@@ -231,6 +269,18 @@ class LangTestcase(TinyCalTestCase):
         stdout = self.run_with_args(['--lang=jp', '--cont', '2020'])
         self.check_output('lang=jp cont', stdout)
 
+    def test_str_width(self):
+        from tinycal import render
+
+        # Full-width characters take two columns, memoized or not
+        for lang in tcal.LANG.values():
+            for s in [s for strs in lang.values() for s in strs] + ['{} 2020'.format(m) for m in lang['month']]:
+                expected = sum(2 if c >= '\u2e80' else 1 for c in s)
+                render.str_widths.clear()
+                self.assertEqual((render.str_width(s), render.str_width(s)), (expected, expected))
+
+        self.assertEqual(render.str_width('神無月 (１０月)'), 15)
+
 
 class ColorTestcase(TinyCalTestCase):
     @property
@@ -276,6 +326,20 @@ marks = MOCK_MARKS
 
         self.check_output('color', stdout)
 
+    def test_today_wk_color(self):
+        def today_wk(settings):
+            conf = tcal.TinyCalConfig(dict(settings, wk='true'))
+            output = tcal.render(conf, datetime.date(2020, 3, 1), today=datetime.date(2020, 3, 14))
+            return [line for line in output.split('\n') if ' 13 ' in line][0].split('│')[1].strip()
+
+        # Unset, derived from wk.color: brighter if only the foreground is set
+        self.assertEqual(today_wk({'wk.color': 'red'}), tcal.Color('RED')('11'))
+        self.assertEqual(today_wk({'wk.color': 'black:white'}), tcal.Color('black:white')('11'))
+
+        # Explicitly uncolored
+        self.assertEqual(today_wk({'wk.color': 'red', 'today.wk.color': 'none:none'}), '11')
+        self.assertEqual(today_wk({'wk.color': 'red', 'today.wk.color': 'green'}), tcal.Color('green')('11'))
+
 
 class InvalidConfigTestcase(TinyCalTestCase):
     @property
@@ -294,3 +358,888 @@ today.color = invalid:color
 
     def test_load_invalid_config(self):
         stdout = self.run_with_args([])
+
+
+class DeclarativeConfigTestcase(unittest.TestCase):
+    def test_slots(self):
+        conf = tcal.TinyCalConfig({'today.color': 'RED', 'border.style': 'bold', 'unknown': 'x'})
+        self.assertFalse(hasattr(conf, '__dict__'))
+        self.assertEqual(conf.border_style, 'bold')
+        self.assertEqual(conf.color_today, tcal.Color('RED'))
+        with self.assertRaises(AttributeError):
+            conf.unknown = 1
+
+    def test_replace(self):
+        conf = tcal.TinyCalConfig({'wk': 'true'})
+        copied = conf.replace(wk=False, col=1)
+        self.assertIs(type(copied), tcal.TinyCalConfig)
+        self.assertEqual((conf.wk, conf.col), (True, 3))
+        self.assertEqual((copied.wk, copied.col), (False, 1))
+        self.assertEqual(copied.color_today, conf.color_today)
+
+    def test_inheritance(self):
+        from tinycal.declarative_config import Config, IntegerField, BoolField
+
+        class Base(Config):
+            a = IntegerField(default=1)
+
+        class Derived(Base):
+            b = BoolField(key='bb', default=True)
+
+        conf = Derived({'a': '2', 'bb': 'false', 'b': 'true'})
+        self.assertEqual(list(Derived.fields()), ['a', 'b'])
+        self.assertEqual(repr(conf), 'Derived(a=2,b=False)')
+
+
+class LayeredConfigTestcase(unittest.TestCase):
+    def test_layers(self):
+        conf = tcal.TinyCalConfig.parse_conf(
+                [StringIO('col = 2\ntoday.color = RED'), {'col': '4', 'wk': 'true'}, '/nonexistent/calrc'],
+                environ={'TINYCAL_LANG': 'jp', 'TINYCAL_CACHE': '1'})
+        self.assertEqual(conf.col, 2)
+        self.assertEqual(conf.wk, True)
+        self.assertEqual(conf.lang, 'jp')
+        self.assertEqual(conf.color_today, tcal.Color('RED'))
+
+    def test_snapshot(self):
+        import os
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            user, system = join(tmpdir, 'calrc'), join(tmpdir, 'system')
+            snapshot = join(tmpdir, 'config.snapshot')
+            with open(user, 'w') as f:
+                f.write('col = 2\n')
+            with open(system, 'w') as f:
+                f.write('col = 1\nfill = true\nfill.color = RED\n')
+
+            conf = tcal.TinyCalConfig.load([user, system], snapshot=snapshot)
+            self.assertEqual((conf.col, conf.fill, conf.color_fill), (2, True, tcal.Color('RED')))
+            self.assertTrue(os.path.exists(snapshot))
+
+            # Warm runs skip parsing
+            with patch.object(tcal.TinyCalConfig, 'parse_conf', side_effect=AssertionError):
+                conf = tcal.TinyCalConfig.load([user, system], snapshot=snapshot)
+            self.assertEqual((conf.col, conf.fill, conf.color_fill), (2, True, tcal.Color('RED')))
+
+            # Modified files and environment overrides invalidate the snapshot
+            with open(user, 'w') as f:
+                f.write('col = 3\n')
+            self.assertEqual(tcal.TinyCalConfig.load([user, system], snapshot=snapshot).col, 3)
+            self.assertEqual(tcal.TinyCalConfig.load([user, system], {'TINYCAL_COL': '5'}, snapshot=snapshot).col, 5)
+            self.assertEqual([name for name in os.listdir(tmpdir) if name.endswith('.tmp')], [])
+
+            # Kept in the cache directory only if caching is enabled
+            for setting, files in (('', []), ('1', ['config.snapshot'])):
+                cache = join(tmpdir, 'cache')
+                with patch.dict(os.environ, {'XDG_CACHE_HOME': cache, 'TINYCAL_CACHE': setting}):
+                    self.assertEqual(tcal.TinyCalConfig.load([user, system]).col, 3)
+
+                self.assertEqual(os.listdir(join(cache, 'tinycal')) if os.path.isdir(cache) else [], files)
+
+
+class MonthRangeTestcase(TinyCalTestCase):
+    @property
+    def args(self):
+        return ['--border=single', '--color=never', '--col=1']
+
+    def test_year_wrap(self):
+        import re
+
+        # Every month once, the years advance at every December / January
+        for today, before, after in (('2020/01/15', 14, 1), ('2019/12/15', 1, 14), ('2020/06/15', 30, 30)):
+            output = self.run_with_args(['--today=' + today, '-B', str(before), '-A', str(after)]).getvalue()
+            year, month = map(int, today.split('/')[:2])
+            expected = []
+            for _ in range(before):
+                year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+            for _ in range(before + after + 1):
+                expected.append(datetime.date(year, month, 1).strftime('%B %Y'))
+                year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+
+            self.assertEqual(re.findall(r'[A-Z][a-z]+ \d{4}', output), expected)
+
+
+class RenderApiTestcase(unittest.TestCase):
+    def test_render(self):
+        conf = tcal.TinyCalConfig({'wk': 'true', 'fill': 'true'})
+        tcal.disable_colors(conf)
+        output = tcal.render(conf, datetime.date(2020, 3, 1), today=datetime.date(2020, 3, 14))
+        with open(join('tests', 'expected_output', 'border=single')) as f:
+            self.assertEqual(output, f.read().rstrip('\n'))
+
+    def test_build_cells(self):
+        conf = tcal.TinyCalConfig({})
+        cells = tcal.build_cells(conf, tcal.month_range(datetime.date(2020, 1, 1), datetime.date(2020, 12, 1)))
+        self.assertEqual(len(cells), 12)
+        self.assertEqual(cells[2].title, 'March 2020')
+
+    def test_run_keeps_conf(self):
+        conf = tcal.TinyCalConfig({'border': 'true', 'col': '3'})
+        args = tcal.parse_args(['--color=never', '--border=off', '--col=2', '--today=2020/03/14', '2020'])
+        lines = list(tcal.run(conf, args, False))
+        self.assertEqual(lines[0].split(), ['January', '2020', 'February', '2020'])
+        self.assertNotIn('\033', ''.join(lines))
+        self.assertEqual((conf.border, conf.col, conf.color_today), ('true', 3, tcal.Color('none:white')))
+
+
+class SgrCoalesceTestcase(TinyCalTestCase):
+    @property
+    def calrc(self):
+        return StringIO('''
+border.color = cyan
+title.color = BLACK:cyan
+wk.color = black:white
+weekday.color = YELLOW
+sunday.color = red
+saturday.color = green
+fill.color = BLACK
+''')
+
+    def screen(self, output):
+        # (character, attributes) of every column, only the background matters for spaces
+        from tinycal import sgr
+
+        ret = []
+        for line in output.split('\n'):
+            cells = []
+            state = sgr.DEFAULT
+            for idx, chunk in enumerate(line.split(sgr.ESC)):
+                if idx:
+                    end = chunk.index('m')
+                    state = sgr.apply(state, chunk[:end])
+                    chunk = chunk[end + 1:]
+
+                cells += [(c, state[2] if c == ' ' else state) for c in chunk]
+
+            self.assertEqual(state, sgr.DEFAULT)
+            ret.append(cells)
+
+        return ret
+
+    def test_coalesce(self):
+        for border in ('full,single', 'full,bold,noweld', 'basic', 'off'):
+            args = ['--color=always', '--today=2020/03/14', '--wk', '--fill', '--border=' + border, '2020']
+            output = self.run_with_args(args).getvalue()
+            coalesced = self.run_with_args(args + ['--sgr-coalesce']).getvalue()
+
+            self.assertEqual(self.screen(output), self.screen(coalesced))
+            self.assertLess(len(coalesced), len(output) * 0.85)
+
+
+class JsonFormatTestcase(TinyCalTestCase):
+    def test_json(self):
+        import json
+
+        output = self.run_with_args(['--format=json', '--today=2020/03/14', '--color=always', '2020', '3']).getvalue()
+        doc = json.loads(output)
+        self.assertEqual(doc['today'], '2020-03-14')
+        self.assertEqual(len(doc['cells']), 1)
+
+        cell = doc['cells'][0]
+        self.assertEqual((cell['title'], cell['year'], cell['month']), ('March 2020', 2020, 3))
+        self.assertEqual([week['wk'] for week in cell['weeks']], [10, 11, 12, 13, 14])
+        self.assertNotIn('\033', output)
+
+        days = [day for week in cell['weeks'] for day in week['days']]
+        self.assertEqual([day['date'] for day in days if day.get('today')], ['2020-03-14'])
+        self.assertEqual([day['date'] for day in days if day['fill']], ['2020-04-0{}'.format(d) for d in range(1, 5)])
+
+    def test_marks(self):
+        import json
+
+        conf = tcal.TinyCalConfig({})
+        lines = tcal.render_json_lines(conf, [tcal.month_range(datetime.date(2020, 1, 1), datetime.date(2020, 2, 1))],
+                                       today=datetime.date(2020, 3, 14), cont=True,
+                                       marks={datetime.date(2020, 2, 3): tcal.Color('RED')})
+        doc = json.loads('\n'.join(lines))
+        self.assertEqual(len(doc['cells']), 1)
+        self.assertEqual((doc['cells'][0]['from'], doc['cells'][0]['to']), ('2020-01', '2020-02'))
+
+        colors = {day['date']: day['color'] for week in doc['cells'][0]['weeks'] for day in week['days'] if 'color' in day}
+        self.assertEqual(colors, {'2020-02-03': 'RED:none'})
+
+
+class WatchTestcase(unittest.TestCase):
+    def test_differential_repaint(self):
+        import os
+        import tempfile
+        from tinycal.watch import Watcher
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = join(tmpdir, 'marks')
+            with open(path, 'w') as f:
+                f.write('2020/03/03 RED\n')
+
+            args = tcal.parse_args(['--color=always', '--today=2020/03/14', '--marks', path, '2020', '3'])
+            with patch.dict('os.environ', {'XDG_CACHE_HOME': tmpdir}):
+                watcher = Watcher(args, calrcs=[{}])
+
+                out = watcher.step()
+                self.assertTrue(out.startswith('\033[H\033[2J'))
+                self.assertEqual(out.count('\033[K'), len(watcher.lines))
+                self.assertEqual(watcher.step(), '')
+
+                with open(path, 'a') as f:
+                    f.write('2020/03/25 GREEN\n')
+                os.utime(path, ns=(0, 0))
+
+                out = watcher.step()
+
+        # Only the line of 2020/03/25 is repainted
+        self.assertEqual(out.count('\033[K'), 1)
+        self.assertIn(tcal.Color('GREEN')('25'), out)
+
+    def test_change_during_render(self):
+        import os
+        import tempfile
+        from tinycal import marks
+        from tinycal.watch import Watcher
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = join(tmpdir, 'marks')
+            with open(path, 'w') as f:
+                f.write('2020/03/03 RED\n')
+
+            original = marks.load_marks
+
+            def load_marks(*args):
+                # Modified after the file is read
+                ret = original(*args)
+                with open(path, 'a') as f:
+                    f.write('2020/03/25 GREEN\n')
+                os.utime(path, ns=(0, 0))
+                return ret
+
+            args = tcal.parse_args(['--color=always', '--today=2020/03/14', '--marks', path, '2020', '3'])
+            with patch.dict('os.environ', {'XDG_CACHE_HOME': tmpdir}):
+                watcher = Watcher(args, calrcs=[{}])
+                with patch.object(marks, 'load_marks', side_effect=load_marks):
+                    watcher.step()
+
+                self.assertNotIn(tcal.Color('GREEN')('25'), '\n'.join(watcher.lines))
+                self.assertIn(tcal.Color('GREEN')('25'), watcher.step())
+
+
+class AsyncioTestcase(unittest.TestCase):
+    def test_calendar_stream(self):
+        import asyncio
+        import os
+        import tempfile
+        from tinycal.aio import calendar_stream
+
+        conf = tcal.TinyCalConfig({})
+        today = datetime.date.today()
+        marked = today.replace(day=1 if today.day != 1 else 2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = join(tmpdir, 'marks')
+            with open(path, 'w') as f:
+                f.write('')
+
+            async def consume():
+                stream = calendar_stream(conf, start=today, marks=path, interval=0.01)
+                first = await stream.__anext__()
+
+                # Nothing changed, the stream stays idle
+                pending = asyncio.ensure_future(stream.__anext__())
+                await asyncio.sleep(0.05)
+                self.assertFalse(pending.done())
+
+                with open(path, 'w') as f:
+                    f.write(marked.strftime('%Y/%m/%d') + ' RED\n')
+                os.utime(path, ns=(0, 0))
+
+                second = await asyncio.wait_for(pending, 1)
+                await stream.aclose()
+                return first, second
+
+            with patch.dict('os.environ', {'XDG_CACHE_HOME': tmpdir}):
+                first, second = asyncio.run(consume())
+
+        self.assertNotIn(tcal.Color('RED')('{:>2}'.format(marked.day)), first)
+        self.assertIn(tcal.Color('RED')('{:>2}'.format(marked.day)), second)
+
+
+class BatchTestcase(unittest.TestCase):
+    def test_render_batch(self):
+        from tinycal.batch import render_batch
+
+        today = datetime.date(2020, 3, 14)
+        confs = []
+        for lang, start_monday in (('en', False), ('zh', False), ('jp', True), ('en', True)):
+            conf = tcal.TinyCalConfig({'lang': lang, 'start_monday': str(start_monday), 'wk': 'true'})
+            tcal.disable_colors(conf)
+            confs.append(conf)
+
+        jobs = [(conf, None) for conf in confs]
+        outputs, stats = render_batch(jobs, datetime.date(2120, 1, 1), datetime.date(2120, 3, 1), today=today)
+        self.assertEqual(stats.renders, 4)
+        self.assertEqual(stats.layouts, 2)
+        for conf, output in zip(confs, outputs):
+            self.assertEqual(output, tcal.render(conf, datetime.date(2120, 1, 1), datetime.date(2120, 3, 1), today=today))
+
+    def test_cont_abbr_across_years(self):
+        conf = tcal.TinyCalConfig({})
+        cells = tcal.build_cells(conf, tcal.month_range(datetime.date(2020, 1, 1), datetime.date(2021, 12, 1)),
+                                 today=datetime.date(2020, 3, 14), cont=True)
+        abbrs = [month for wk, days, month in cells[0].lines if month]
+        self.assertEqual(abbrs.count('Jan'), 2)
+
+
+class CompactCellTestcase(unittest.TestCase):
+    def test_recolor(self):
+        from tinycal.render import TinyCalRenderer
+
+        conf = tcal.TinyCalConfig({'sunday.color': 'RED', 'fill': 'true'})
+        months = tcal.month_range(datetime.date(2020, 1, 1), datetime.date(2020, 12, 1))
+        marks = {datetime.date(2020, 3, 18): tcal.Color('BLUE')}
+        cells = tcal.build_cells(conf, months, today=datetime.date(2020, 3, 14), marks=marks)
+
+        # The weeks are shared with the layout, 8 color indices per week
+        self.assertEqual(len(cells[0].colors), 8 * len(cells[0].weeks))
+        self.assertIs(cells[0].palette, cells[-1].palette)
+
+        cells[0].palette.replace(tcal.Color('RED'), tcal.Color('green:white'))
+        recolored = conf.replace(color_sunday=tcal.Color('green:white'))
+        self.assertEqual(TinyCalRenderer(conf, cells).render(),
+                         tcal.render(recolored, months[0], months[-1], today=datetime.date(2020, 3, 14), marks=marks))
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class NumpyEngineTestcase(unittest.TestCase):
+    def test_identical_output(self):
+        # Falls back to the pure Python engine without NumPy
+        conf = tcal.TinyCalConfig({'sunday.color': 'RED', 'wk.color': 'BLACK', 'fill.color': 'BLACK', 'wk': 'true'})
+        marks = {datetime.date(2020, 3, 18): tcal.Color('BLUE'), datetime.date(2020, 3, 14): tcal.Color('GREEN'),
+                 datetime.date(2019, 2, 1): tcal.Color('cyan:white'), datetime.date(2021, 1, 1): tcal.Color('RED')}
+        for cont in (False, True):
+            for fill in ('false', 'true'):
+                python = conf.replace(fill=fill == 'true')
+                vectorized = conf.replace(fill=fill == 'true', engine='numpy')
+                args = (datetime.date(2019, 1, 1), datetime.date(2020, 12, 1))
+                kwargs = {'today': datetime.date(2020, 3, 14), 'marks': marks, 'cont': cont}
+                self.assertEqual(tcal.render(vectorized, *args, **kwargs), tcal.render(python, *args, **kwargs))
+
+    @unittest.skipUnless(numpy, 'NumPy is not installed')
+    def test_week_colors(self):
+        from tinycal import vectorized
+
+        self.assertIs(tcal.load_engine('numpy'), vectorized)
+        conf = tcal.TinyCalConfig({'sunday.color': 'RED'})
+        months = tcal.month_range(datetime.date(2020, 1, 1), datetime.date(2020, 12, 1))
+        marks = {datetime.date(2020, 3, 18): tcal.Color('BLUE')}
+        cells = tcal.build_cells(conf, months, today=datetime.date(2020, 3, 14), marks=marks)
+        vectorized_cells = tcal.build_cells(conf.replace(engine='numpy'), months,
+                                            today=datetime.date(2020, 3, 14), marks=marks)
+        self.assertEqual([cell.colors for cell in vectorized_cells], [cell.colors for cell in cells])
+
+
+class MonthTemplateTestcase(unittest.TestCase):
+    def test_templates(self):
+        from tinycal.layout import month_template, month_length, monthdatescalendar
+
+        # All 14 year types, both first weekdays
+        for year in range(2017, 2045):
+            for month in range(1, 13):
+                first = datetime.date(year, month, 1)
+                prev = first - datetime.timedelta(days=1)
+                for firstweekday in (tcal.MONDAY, tcal.SUNDAY):
+                    rows = month_template(first.weekday(), month_length(year, month), prev.day, firstweekday)
+                    weeks = monthdatescalendar(year, month, firstweekday)
+                    self.assertEqual([row.days for row in rows], [tuple(d.day for d in week) for week in weeks])
+                    self.assertEqual([row.in_range for row in rows],
+                                     [tuple(d.month == month for d in week) for week in weeks])
+
+        self.assertLessEqual(month_template.cache_info().currsize, 7 * 4 * 4 * 2)
+
+
+class ServerTestcase(unittest.TestCase):
+    def test_request(self):
+        import tempfile
+        import threading
+        from tinycal import client, server
+
+        argv = ['--border=single', '--color=never', '--today=2020/03/14', '--fill', '--wk']
+        with tempfile.TemporaryDirectory() as tmpdir:
+            s = server.TinyCalServer(join(tmpdir, 'tcal.sock'), calrcs=[{}])
+            s.bind()
+            try:
+                for i in range(2):
+                    t = threading.Thread(target=s.serve_once)
+                    t.start()
+                    reply = client.request(s.path, argv)
+                    t.join()
+
+                    self.assertEqual(reply['status'], 0)
+                    with open(join('tests', 'expected_output', 'border=single')) as f:
+                        self.assertEqual(reply['stdout'], f.read().rstrip('\n') + '\n')
+
+                self.assertEqual(len(s.outputs), 1)
+
+                t = threading.Thread(target=s.serve_once)
+                t.start()
+                reply = client.request(s.path, ['--border=invalid'])
+                t.join()
+                self.assertEqual(reply['status'], 2)
+                self.assertIn('invalid choice', reply['stderr'])
+            finally:
+                s.close()
+
+    def test_client_environ(self):
+        import os
+        import tempfile
+        import threading
+        from tinycal import client, server
+
+        argv = ['--color=never', '--today=2020/03/14']
+        with tempfile.TemporaryDirectory() as tmpdir:
+            s = server.TinyCalServer(join(tmpdir, 'tcal.sock'), calrcs=[{}])
+            s.bind()
+            try:
+                outputs = []
+                for border in ('off', 'full', 'off'):
+                    t = threading.Thread(target=s.serve_once)
+                    t.start()
+                    with patch.dict(os.environ, {'TINYCAL_BORDER': border}):
+                        outputs.append(client.request(s.path, argv)['stdout'])
+                    t.join()
+
+                # Parsed for every request, not once for the server
+                self.assertNotIn('│', outputs[0])
+                self.assertIn('┌──', outputs[1])
+                self.assertIn('│ 29 30 31             │', outputs[1])
+                self.assertEqual(outputs[0], outputs[2])
+                self.assertEqual(len(s.outputs), 2)
+
+                # Not the environment of the server
+                with patch.dict(os.environ, {'TINYCAL_BORDER': 'off'}):
+                    self.assertEqual(s.handle({'argv': argv, 'env': {}})['stdout'], outputs[1])
+            finally:
+                s.close()
+
+    def test_client_cwd(self):
+        import os
+        import tempfile
+        from tinycal import server
+
+        argv = ['--color=always', '--today=2020/03/14']
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(join(tmpdir, 'marks'), 'w') as f:
+                f.write('2020/03/18 BLUE\n')
+
+            s = server.TinyCalServer(join(tmpdir, 'tcal.sock'), calrcs=[{}])
+            cwd = os.getcwd()
+            plain = s.handle({'argv': argv, 'cwd': tmpdir})['stdout']
+            for req in ({'argv': argv + ['--marks', 'marks'], 'cwd': tmpdir},
+                        {'argv': argv + ['--mark=marks'], 'cwd': tmpdir},
+                        {'argv': argv, 'cwd': tmpdir, 'env': {'TINYCAL_MARKS': 'marks'}}):
+                reply = s.handle(req)
+                self.assertEqual(reply['status'], 0, reply['stderr'])
+                self.assertNotEqual(reply['stdout'], plain)
+                self.assertEqual(os.getcwd(), cwd)
+
+    def test_marks_cache(self):
+        import tempfile
+        from tinycal import server
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            marks = join(tmpdir, 'marks')
+            with open(marks, 'w') as f:
+                f.write('2020/03/18 BLUE\n')
+
+            s = server.TinyCalServer(join(tmpdir, 'tcal.sock'), calrcs=[{}])
+            s.marks_cache_size = 2
+            for month in (1, 2, 1, 3):
+                s.load_marks(marks, datetime.date(2020, month, 1), datetime.date(2020, 12, 1))
+
+            # The least recently used range is dropped
+            self.assertEqual([key[1].month for key in s.marks], [1, 3])
+
+            # Not loaded without colors, but closed
+            args = tcal.parse_args(['--color=never', '--marks', marks, '--today=2020/03/14'])
+            list(tcal.run(tcal.TinyCalConfig({}), args, False, s.load_marks))
+            self.assertTrue(args.marks.closed)
+
+
+class RenderCacheTestcase(unittest.TestCase):
+    def test_cache(self):
+        import os
+        import tempfile
+        from tinycal.cache import RenderCache
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            marks = join(tmpdir, 'marks')
+            with open(marks, 'w') as f:
+                f.write('2020/03/18 BLUE\n')
+
+            cache = RenderCache(join(tmpdir, 'render'), max_size=100)
+            key = cache.key(['-3'], False)
+            self.assertIsNone(cache.get(key))
+
+            cache.put(key, 'output\n', deps=[marks, join(tmpdir, 'nonexist')])
+            self.assertEqual(cache.get(key), 'output\n')
+            self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+            # Changing a dependency invalidates the entry
+            os.utime(marks, ns=(0, 0))
+            self.assertIsNone(cache.get(key))
+
+            # Least recently used entries are evicted
+            for i in range(5):
+                cache.put(cache.key([str(i)], False), 'x' * 30, deps=[])
+
+            self.assertLessEqual(sum(size for _, size, _ in cache.entries()), 100)
+            self.assertEqual(cache.get(cache.key(['0'], False)), None)
+            self.assertEqual(cache.get(cache.key(['4'], False)), 'x' * 30)
+
+    def test_hit_writes(self):
+        import os
+        import tempfile
+        from tinycal.cache import RenderCache
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = RenderCache(join(tmpdir, 'render'))
+            key = cache.key(['-3'], False)
+            self.assertIsNone(cache.get(key))
+            cache.put(key, 'output\n', deps=[])
+            self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1})
+
+            # Hits only append to the log, the fresh entry is not touched
+            with patch('json.dump', side_effect=AssertionError), patch('os.utime', side_effect=AssertionError):
+                for _ in range(3):
+                    self.assertEqual(cache.get(key), 'output\n')
+
+            self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1})
+
+            # Folded when an entry is written
+            cache.put(cache.key(['-1'], False), 'output\n', deps=[])
+            self.assertFalse(os.path.exists(cache.log_path()))
+            self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1})
+            self.assertIn('hit rate: 75.0%', cache.report())
+
+
+class StartupTestcase(unittest.TestCase):
+    def test_default_args(self):
+        from tinycal import cli
+        self.assertEqual(vars(cli.default_args()), vars(cli.parser.parse_args([])))
+
+    def test_deferred_imports(self):
+        import os
+        import subprocess
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(os.environ, HOME=home)
+            env.pop('TINYCAL_CACHE', None)
+            proc = subprocess.run(
+                    [sys.executable, '-c', 'import sys; from tinycal.__main__ import main; main([]); print(*sys.modules)'],
+                    env=env, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+
+        modules = proc.stdout.splitlines()[-1].split()
+        for m in ('argparse', 'configparser', 'calendar'):
+            self.assertNotIn(m, modules)
+
+
+class BenchmarkSuiteTestcase(unittest.TestCase):
+    def test_measure(self):
+        import os
+        import tempfile
+        from benchmarks import suite
+
+        scenarios = dict(suite.SCENARIOS)
+        with tempfile.TemporaryDirectory() as workdir, patch.object(tcal, 'CALRCS', tcal.CALRCS), \
+                patch.dict(os.environ, {'XDG_CACHE_HOME': workdir}):
+            # The scenarios replace the configuration sources, and are not cached
+            os.environ.pop('TINYCAL_CACHE', None)
+            result = suite.measure(scenarios['main/1-month'], workdir, runs=1)
+
+        self.assertGreater(result['seconds'], 0)
+        self.assertGreater(result['peak'], 0)
+        self.assertGreater(result['bytes'], 0)
+
+        baseline = {'main/1-month': dict(result, seconds=0.05)}
+        slower = {'main/1-month': dict(result, seconds=0.1)}
+        self.assertEqual(suite.compare(slower, baseline, 0.25), [('main/1-month', 'seconds', 0.05, 0.1)])
+        self.assertEqual(suite.compare({'main/1-month': result}, {'main/1-month': result}, 0.25), [])
+
+
+class ProfileTestcase(TinyCalTestCase):
+    def test_profile(self):
+        import json
+        import tempfile
+        from tinycal.config import Color
+
+        color_call = Color.__call__
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = join(tmpdir, 'profile.jsonl')
+            for i in range(2):
+                output = self.run_with_args(['--profile=' + path, '--color=always', '--today=2020/03/14', '2020']).getvalue()
+
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['counters']['cells'], 12)
+        self.assertEqual(records[0]['counters']['lines'], len(output.splitlines()))
+        self.assertEqual(records[0]['counters']['bytes'], len(output.encode('utf-8')))
+        self.assertGreater(records[0]['counters']['colors'], 0)
+        for phase in ('argparse', 'config', 'cells', 'render', 'write'):
+            self.assertIn(phase, records[0]['phases_ms'])
+
+        # The hooks are removed
+        self.assertIs(Color.__call__, color_call)
+        self.assertEqual(tcal.iter_cells.__qualname__, 'iter_cells')
+
+
+class MarksTestcase(unittest.TestCase):
+    def test_indexed_marks(self):
+        import os
+        import tempfile
+        from tinycal import marks
+
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {'XDG_CACHE_HOME': tmpdir}):
+            path = join(tmpdir, 'marks')
+            with open(path, 'w') as f:
+                for year in range(2000, 2030):
+                    f.write('{}/03/18 BLUE\n'.format(year))
+                f.write('2020/03/19\n')
+                f.write('2020/03/20 invalid:color\n')
+                f.write('2020/03/18 RED\n')
+
+            with patch('sys.stderr', new_callable=StringIO) as stderr:
+                date_marks = marks.load_marks(path, datetime.date(2020, 2, 1), datetime.date(2020, 4, 1))
+
+            self.assertEqual(list(date_marks), [datetime.date(2020, 3, 18)])
+            self.assertEqual(str(date_marks[datetime.date(2020, 3, 18)]), 'RED:none')
+            self.assertIn('2 invalid line(s)', stderr.getvalue())
+
+            # The index is reused
+            index_path = marks.index_path(os.path.realpath(path))
+            self.assertTrue(os.path.exists(index_path))
+            with open(path) as f:
+                st = os.fstat(f.fileno())
+                index = marks.MarksIndex.open(index_path, (st.st_mtime_ns, st.st_size))
+            self.assertEqual(len(index), 31)
+
+            # Saved through a temporary file of its own, not blocked by the one of another run
+            os.unlink(index_path)
+            os.mkdir(index_path + '.tmp')
+            marks.MarksIndex.save(index_path, ['2020/03/18 BLUE'], (st.st_mtime_ns, st.st_size))
+            self.assertEqual(len(marks.MarksIndex.open(index_path, (st.st_mtime_ns, st.st_size))), 1)
+            self.assertEqual(sorted(os.listdir(os.path.dirname(index_path))),
+                             sorted([os.path.basename(index_path), os.path.basename(index_path) + '.tmp']))
+
+    def test_ranges_and_rules(self):
+        import os
+        import tempfile
+        from tinycal import marks
+
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {'XDG_CACHE_HOME': tmpdir}):
+            path = join(tmpdir, 'marks')
+            with open(path, 'w') as f:
+                f.write('2020/12/20..2021/01/03 red\n')
+                f.write('weekly fri GREEN  # standup\n')
+                f.write('monthly last fri blue\n')
+                f.write('yearly 12/25 YELLOW\n')
+                f.write('2020/12/24 cyan\n')
+                f.write('monthly 5th caturday red\n')
+
+            for _ in range(2):
+                # Parsed, then loaded from the index
+                with patch('sys.stderr', new_callable=StringIO) as stderr:
+                    date_marks = marks.load_marks(path, datetime.date(2020, 12, 1), datetime.date(2021, 1, 1))
+
+                self.assertIn('1 invalid line(s)', stderr.getvalue())
+                colors = {d.strftime('%m/%d'): str(c) for d, c in date_marks.items()}
+                self.assertEqual(colors['12/04'], 'GREEN:none')
+                self.assertEqual(colors['12/20'], 'red:none')
+                self.assertEqual(colors['12/24'], 'cyan:none')
+                self.assertEqual(colors['12/25'], 'YELLOW:none')
+                self.assertEqual(colors['01/01'], 'GREEN:none')
+                self.assertEqual(colors['01/03'], 'red:none')
+                self.assertEqual(colors['01/29'], 'blue:none')
+                self.assertNotIn('01/04', colors)
+                self.assertEqual(len(date_marks), 15 + 7)
+
+            index = marks.MarksIndex.build(['weekly mon red'] * 1000)
+            self.assertEqual((len(index), len(index.rules)), (0, 1000))
+
+    def test_ics(self):
+        import os
+        import tempfile
+        from tinycal import marks
+
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {'XDG_CACHE_HOME': tmpdir}):
+            path = join(tmpdir, 'events.ics')
+            with open(path, 'w') as f:
+                f.write('\r\n'.join([
+                    'BEGIN:VCALENDAR',
+                    'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20201224', 'DTEND;VALUE=DATE:20201226',
+                    'CATEGORIES:Holiday', 'END:VEVENT',
+                    'BEGIN:VEVENT', 'DTSTART;TZID=Asia/Taipei:20201201T093000',
+                    'RRULE:FREQ=MONTHLY;BYDAY=-1FR', 'CATEGORIES:Work,Meeting', 'END:VEVENT',
+                    'BEGIN:VEVENT', 'DTSTART:20201201T093000', 'RRULE:FREQ=DAILY;INTERVAL=2', 'END:VEVENT',
+                    'END:VCALENDAR', '']))
+
+            for categories in ('holiday=RED, meeting=blue:white', 'holiday=RED, meeting=blue:white', '*=cyan'):
+                with patch('sys.stderr', new_callable=StringIO) as stderr:
+                    date_marks = marks.load_marks(path, datetime.date(2020, 12, 1), datetime.date(2021, 1, 1),
+                                                  categories)
+
+                self.assertIn('1 invalid line(s)', stderr.getvalue())
+                colors = {d.strftime('%m/%d'): str(c) for d, c in date_marks.items()}
+                if categories == '*=cyan':
+                    self.assertEqual(set(colors.values()), {'cyan:none'})
+                else:
+                    # The last Friday is a latter event
+                    self.assertEqual(colors, {'12/24': 'RED:none', '12/25': 'blue:white', '01/29': 'blue:white'})
+
+            # Indexed per mapping
+            self.assertEqual(len(os.listdir(join(tmpdir, 'tinycal', 'marks'))), 2)
+
+    def test_ics_exceptions(self):
+        from tinycal import marks
+        from tinycal.ics import mark_lines
+
+        events = mark_lines([
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20210104', 'RRULE:FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20210131',
+            'EXDATE;VALUE=DATE:20210111,20210113', 'EXDATE:20210120T090000', 'RDATE;VALUE=DATE:20210130',
+            'END:VEVENT',
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20210105', 'STATUS:CANCELLED', 'END:VEVENT',
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20210101', 'CATEGORIES:x', 'END:VEVENT',
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20210201', 'RDATE;VALUE=PERIOD:20210202/P1D', 'END:VEVENT',
+            # The first Tuesday is an occurrence of both rules, counted once
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20210302', 'RRULE:FREQ=MONTHLY;BYDAY=1TU,TU;COUNT=3', 'END:VEVENT',
+        ], {'x': 'GREEN'})
+        lines = list(events)
+        self.assertEqual(events.invalid, 1)
+        self.assertEqual(marks.MarksIndex.build(events).invalid, 1)
+
+        date_marks = marks.load_marks(StringIO('\n'.join(lines)), datetime.date(2021, 1, 1), datetime.date(2021, 3, 1))
+        self.assertEqual(sorted(d.strftime('%m/%d') for d in date_marks), [
+            '01/01', '01/04', '01/06', '01/18', '01/25', '01/27', '01/30', '03/02', '03/09', '03/16'])
+
+    def test_unbounded_rules(self):
+        from tinycal import marks
+
+        # Without a range, the rules are expanded within the dates and ranges of the file
+        date_marks = marks.load_marks(StringIO('weekly fri RED\n2020/03/02 BLUE\n2020/03/01..2020/03/31 monthly 20 red'))
+        self.assertEqual(sorted(d.strftime('%m/%d') for d in date_marks), ['03/02', '03/06', '03/13', '03/20', '03/27'])
+        self.assertEqual(marks.load_marks(StringIO('weekly fri RED')), {})
+
+        # The last month
+        date_marks = marks.load_marks(StringIO('monthly last fri red'), datetime.date(9999, 11, 1), datetime.date(9999, 12, 1))
+        self.assertEqual(sorted(d.isoformat() for d in date_marks), ['9999-11-26', '9999-12-31'])
+        date_marks = marks.load_marks(StringIO('monthly 31 red'), datetime.date(9999, 12, 1), datetime.date(9999, 12, 1))
+        self.assertEqual(list(date_marks), [datetime.date(9999, 12, 31)])
+
+    def test_ics_bymonth(self):
+        from tinycal import marks
+        from tinycal.ics import mark_lines
+
+        lines = list(mark_lines([
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20200601', 'RRULE:FREQ=WEEKLY;BYMONTH=6;BYDAY=MO', 'END:VEVENT',
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20200201', 'RRULE:FREQ=DAILY;BYMONTH=2;COUNT=31', 'END:VEVENT',
+            'BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20200131', 'RRULE:FREQ=MONTHLY;BYMONTH=1,2,3', 'END:VEVENT',
+        ]))
+
+        date_marks = marks.load_marks(StringIO('\n'.join(lines)), datetime.date(2020, 1, 1), datetime.date(2021, 12, 31))
+        self.assertEqual(sorted(d.isoformat() for d in date_marks if d.month == 6), [
+            '2020-06-01', '2020-06-08', '2020-06-15', '2020-06-22', '2020-06-29',
+            '2021-06-07', '2021-06-14', '2021-06-21', '2021-06-28'])
+        # 29 days of 2020, 2 days of 2021
+        self.assertEqual(sorted(d.isoformat() for d in date_marks if d.month == 2),
+                         ['2020-02-{:02}'.format(d) for d in range(1, 30)] + ['2021-02-01', '2021-02-02'])
+        self.assertEqual(sorted(d.isoformat() for d in date_marks if d.month in (1, 3)),
+                         ['2020-01-31', '2020-03-31', '2021-01-31', '2021-03-31'])
+
+
+class WeekNumberingTestcase(unittest.TestCase):
+    def test_matches_isocalendar(self):
+        from tinycal.weeknum import WeekNumbering, MONDAY
+        wn = WeekNumbering('iso', MONDAY)
+        for year in range(2000, 2030):
+            for week in tcal.monthdatescalendar(year, 1, MONDAY):
+                self.assertEqual(wn(week[0]), week[0].isocalendar()[1])
+
+    def test_render_iso(self):
+        conf = tcal.TinyCalConfig({'wk': 'true', 'wk.rule': 'iso', 'start_monday': 'true'})
+        tcal.disable_colors(conf)
+        output = tcal.render(conf, datetime.date(2021, 1, 1), today=datetime.date(2021, 1, 1))
+        self.assertIn('│ 53 │              1  2  3 │', output)
+        self.assertIn('│  1 │  4  5  6  7  8  9 10 │', output)
+
+
+class StreamingRenderTestcase(unittest.TestCase):
+    def test_long_range(self):
+        conf = tcal.TinyCalConfig({})
+        tcal.disable_colors(conf)
+
+        # 4800 months, 1600 rows of cells
+        lines = tcal.render_lines(conf, datetime.date(2000, 1, 1), datetime.date(2399, 12, 1))
+        self.assertEqual(next(lines).strip(), '┌' + '─' * 22 + '┬' + '─' * 22 + '┬' + '─' * 22 + '┐')
+        self.assertTrue(any('December 2399' in line for line in lines))
+
+    def test_lazy_layout(self):
+        from tinycal.layout import layout, year_layout
+
+        conf = tcal.TinyCalConfig({})
+        tcal.disable_colors(conf)
+
+        # The first row of cells only lays out its year
+        year_layout.cache_clear()
+        lines = tcal.render_lines(conf, datetime.date(2000, 1, 1), datetime.date(2099, 12, 1))
+        next(lines)
+        self.assertEqual(year_layout.cache_info().misses, 1)
+
+        # Only the recent years are kept
+        for line in lines:
+            pass
+        self.assertEqual(year_layout.cache_info().misses, 100)
+        self.assertLessEqual(year_layout.cache_info().currsize, year_layout.cache_info().maxsize)
+        self.assertFalse(hasattr(layout, 'cache_info'))
+
+
+class RangeTestcase(TinyCalTestCase):
+    @property
+    def args(self):
+        return ['--border=single', '--color=never', '--today=2020/03/14', '--fill', '--wk']
+
+    def test_year_range(self):
+        stdout = self.run_with_args(['2019..2021'])
+        blocks = stdout.getvalue().split('\n\n')
+        self.assertEqual(len(blocks), 3)
+        with open(join('tests', 'expected_output', 'border=single 2020')) as f:
+            self.assertEqual(blocks[1], f.read().rstrip('\n'))
+
+    def test_month_range(self):
+        stdout = self.run_with_args(['2019/12..2020/01'])
+        output = stdout.getvalue()
+        self.assertIn('December 2019', output.split('\n\n')[0])
+        self.assertIn('January 2020', output.split('\n\n')[1])
+
+    def test_page_rows(self):
+        stdout = self.run_with_args(['2020', '--page-rows=30'])
+        pages = stdout.getvalue().split('\f')
+        self.assertEqual(len(pages), 2)
+        for page in pages:
+            lines = page.rstrip('\n').split('\n')
+            self.assertLessEqual(len(lines), 30)
+            self.assertTrue(lines[0].startswith('┌'))
+            self.assertTrue(lines[-1].startswith('└'))
+
+    def test_page_rows_year_range(self):
+        for page_rows in (20, 21, 30):
+            stdout = self.run_with_args(['2020..2022', '--page-rows={}'.format(page_rows)])
+            pages = stdout.getvalue().split('\f')
+            self.assertGreater(len(pages), 3)
+            for page in pages:
+                # Every line ends with a newline, including the empty line between years
+                self.assertLessEqual(page.count('\n'), page_rows)
+                self.assertTrue(page.startswith('┌'))
+                self.assertTrue(page.rstrip('\n').split('\n')[-1].startswith('└'))
@@ -5,3 +5,27 @@ A Python implementation of `cal` command
 __name__ = 'tinycal'
 __version__ = '0.3.3'
 CALRCS = ('~/.config/calrc', '~/.calrc')
+SYSTEM_CALRC = '/etc/calrc'
+
+# Public API, name -> module
+_api = {
+        'render': 'tcal',
+        'render_lines': 'tcal',
+        'build_cells': 'tcal',
+        'load_marks': 'tcal',
+        'disable_colors': 'tcal',
+        'render_batch': 'batch',
+        }
+
+
+def __getattr__(name):
+    # Import the rendering API on first use, keeps `tcal-client` lightweight
+    if name in _api:
+        # Bind all the names at once, importing `tcal` binds the `render` submodule to the package
+        from importlib import import_module
+        for n, module in _api.items():
+            globals()[n] = getattr(import_module('.' + module, __name__), n)
+
+        return globals()[name]
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -1,5 +1,33 @@
+"""
+Entry point of `tcal` command
+
+Serves cached outputs (see `tinycal.cache`) before importing the renderer.
+"""
+
+import os
 import sys
 
-from . import tcal
 
-tcal.main()
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    cache = None
+    if os.environ.get('TINYCAL_CACHE') and '--no-cache' not in argv:
+        from .cache import RenderCache
+        cache = RenderCache.from_env()
+
+    # Profiled runs are always rendered
+    profiling = os.environ.get('TINYCAL_PROFILE') or any(a.split('=')[0] == '--profile' for a in argv)
+
+    if cache is not None and '--cache-stats' not in argv and '--watch' not in argv and not profiling:
+        output = cache.get(cache.key(argv, sys.stdout.isatty()))
+        if output is not None:
+            sys.stdout.write(output)
+            return
+
+    from . import tcal
+    tcal.main(argv, cache=cache)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Asyncio API
+
+``calendar_stream()`` yields a freshly rendered calendar when the date rolls over
+or the configuration / date marking files change, and sleeps in between.
+The files are checked and read in the default executor, so the event loop is never blocked by them.
+
+::
+
+    async for output in calendar_stream():
+        status_bar.update(output)
+"""
+
+import asyncio
+import os
+
+from datetime import date
+from os.path import expanduser
+
+from . import tcal
+from .config import TinyCalConfig, file_stamp
+from .watch import seconds_to_midnight
+
+
+class CalendarSource:
+    r"""
+    The inputs of a stream, and their stamp (the date and the modification times of the files)
+    """
+    def __init__(self, config=None, start=None, end=None, marks=None, cont=False, grid=False, calrcs=None):
+        self.config = config
+        self.start = start
+        self.end = end
+        self.marks = marks
+        self.cont = cont
+        self.grid = grid
+        self.calrcs = calrcs
+        self.deps = []
+
+    def sources(self):
+        return tcal.config_sources() if self.calrcs is None else self.calrcs
+
+    def stamp(self):
+        return (date.today(), tuple(file_stamp(expanduser(path)) for path in self.deps))
+
+    def render(self):
+        r"""
+        Read the files and render, return the stamp before reading and the output
+        """
+        today = date.today()
+        conf = self.config
+        if conf is None:
+            conf = TinyCalConfig.load(self.sources(), os.environ)
+
+        if self.start is None:
+            months = tcal.calculate_month_range(conf.before, conf.after, today.year, today.month)
+            start, end = months[0], months[-1]
+        else:
+            start, end = self.start, self.end or self.start
+
+        marks = conf.marks if self.marks is None else self.marks
+        self.deps = [rc for rc in self.sources() if isinstance(rc, str)] if self.config is None else []
+        if isinstance(marks, str):
+            self.deps.append(marks)
+
+        stamp = self.stamp()
+        if marks is not None and not isinstance(marks, dict):
+            marks = tcal.load_marks(marks, start, end, conf.marks_categories)
+
+        if self.grid:
+            output = list(tcal.iter_grid(conf, tcal.month_range(start, end), today=today, marks=marks, cont=self.cont))
+        else:
+            output = tcal.render(conf, start, end, today=today, marks=marks, cont=self.cont)
+
+        return stamp, output
+
+
+async def calendar_stream(config=None, start=None, end=None, marks=None, cont=False, grid=False,
+                          interval=5.0, calrcs=None):
+    r"""
+    Yield the rendered calendar, and again whenever the date or the files change
+
+    ``config`` is a TinyCalConfig, loaded from the configuration files (and reloaded when they change) if not given.
+    ``start`` and ``end`` are the displayed months, default to the months around today in the config.
+    ``marks`` is a date marking file (reloaded when it changes) or a ``{date: Color}`` dict,
+    default to the one in the config.
+    The grid of ``iter_grid()`` is yielded instead of the rendered string if ``grid`` is true.
+    The files are checked every ``interval`` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    source = CalendarSource(config, start, end, marks, cont, grid, calrcs)
+
+    stamp = None
+    while True:
+        if stamp is None or stamp != await loop.run_in_executor(None, source.stamp):
+            stamp, output = await loop.run_in_executor(None, source.render)
+            yield output
+
+        await asyncio.sleep(min(interval, seconds_to_midnight() + 0.01))
@@ -0,0 +1,58 @@
+"""
+Batch rendering
+
+Renders the same month range for many configurations, e.g. the team calendars of an intranet.
+The date layout is computed once per distinct ``(start_monday, wk_rule)``,
+only the colors, language and marks of every configuration are applied on top of it.
+"""
+
+import time
+
+from collections import namedtuple
+from datetime import date
+
+from .layout import year_layout
+from .tcal import render
+
+
+class BatchStats(namedtuple('BatchStats', ['renders', 'layouts', 'seconds', 'bytes'])):
+    r"""
+    Throughput of a batch
+
+    >>> print(BatchStats(200, 2, 0.5, 96000))
+    200 renders (2 layouts) in 0.500 s, 400.0 renders/s, 187.5 KiB/s
+    """
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        return self.renders / self.seconds if self.seconds else float('inf')
+
+    def __str__(self):
+        return '{} renders ({} layouts) in {:.3f} s, {:.1f} renders/s, {:.1f} KiB/s'.format(
+                self.renders, self.layouts, self.seconds, self.throughput,
+                (self.bytes / 1024 / self.seconds) if self.seconds else float('inf'))
+
+
+def render_batch(jobs, start, end=None, today=None, cont=False):
+    r"""
+    Render the months from ``start`` to ``end`` for every ``(conf, marks)`` pair of ``jobs``
+
+    Return the list of outputs (in the order of ``jobs``) and the BatchStats.
+    The configs are not modified, colors are expected to be resolved by the caller.
+    """
+    jobs = list(jobs)
+    today = today or date.today()
+
+    misses = year_layout.cache_info().misses
+    t0 = time.perf_counter()
+    outputs = [render(conf, start, end, today=today, marks=marks, cont=cont) for conf, marks in jobs]
+    seconds = time.perf_counter() - t0
+
+    stats = BatchStats(
+            renders=len(outputs),
+            layouts=year_layout.cache_info().misses - misses,
+            seconds=seconds,
+            bytes=sum(len(output.encode('utf-8')) for output in outputs),
+            )
+    return outputs, stats
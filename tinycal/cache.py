@@ -0,0 +1,257 @@
+"""
+Persistent render cache
+
+Enabled by setting ``TINYCAL_CACHE`` environment variable,
+to ``1`` for the default location (``~/.cache/tinycal``) or to a directory.
+The snapshot of the merged configuration is kept there too, see ``TinyCalConfig.load()``.
+
+Every entry is keyed on a hash of the arguments, the current date and the terminal state,
+and records the files it depends on (configuration files and the date marking file),
+an entry is discarded if any of their mtimes changed.
+The cache size is bounded by ``TINYCAL_CACHE_SIZE`` bytes, the least recently used entries are evicted first.
+
+A hit appends one byte to ``stats.log`` and touches its entry at most once a minute,
+the log is folded into ``stats.json`` when an entry is written.
+
+This module should be kept lightweight, cache hits are served without importing the renderer.
+"""
+
+import os
+
+from datetime import date
+from time import time
+from os.path import expanduser, join, abspath
+
+from . import __version__
+
+
+DEFAULT_CACHE_SIZE = 4 * 1024 * 1024
+TOUCH_INTERVAL = 60
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or expanduser('~/.cache')
+    return join(base, 'tinycal')
+
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def enabled_cache_dir():
+    r"""
+    Return the cache directory set by ``TINYCAL_CACHE``, or None if caching is not enabled
+    """
+    setting = os.environ.get('TINYCAL_CACHE', '')
+    if setting.lower() in ('', '0', 'false', 'no'):
+        return None
+
+    return cache_dir() if setting.lower() in ('1', 'true', 'yes') else expanduser(setting)
+
+
+class RenderCache:
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+    @classmethod
+    def from_env(cls):
+        path = enabled_cache_dir()
+        if path is None:
+            return None
+
+        try:
+            max_size = int(os.environ.get('TINYCAL_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+        except ValueError:
+            max_size = DEFAULT_CACHE_SIZE
+
+        return cls(join(path, 'render'), max_size)
+
+    @staticmethod
+    def key(argv, isatty, today=None):
+        import hashlib
+        import json
+
+        # TINYCAL_* variables could override the configuration
+        env = sorted((k, v) for k, v in os.environ.items() if k.startswith('TINYCAL_'))
+
+        h = hashlib.sha1()
+        h.update(json.dumps([
+            __version__, list(argv), bool(isatty), os.getcwd(),
+            (today or date.today()).isoformat(), env,
+            ]).encode('utf-8'))
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return join(self.path, key)
+
+    def get(self, key):
+        import json
+
+        entry = self.entry_path(key)
+        try:
+            with open(entry, encoding='utf-8') as f:
+                deps = json.loads(f.readline())
+                if any(file_stamp(path) != stamp for path, stamp in deps):
+                    output = None
+                else:
+                    output = f.read()
+                    mtime = os.fstat(f.fileno()).st_mtime
+
+        except (OSError, ValueError):
+            output = None
+
+        if output is None:
+            self.count('misses')
+            return None
+
+        # Touch the entry for LRU eviction, a minute is precise enough
+        if time() - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(entry)
+            except OSError:
+                pass
+
+        self.count('hits')
+        return output
+
+    def put(self, key, output, deps):
+        import json
+
+        deps = [(abspath(expanduser(path)), None) for path in deps]
+        deps = [(path, file_stamp(path)) for path, _ in deps]
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = self.entry_path(key) + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(deps) + '\n')
+                f.write(output)
+
+            os.replace(tmp, self.entry_path(key))
+            self.evict()
+            self.fold_stats()
+
+        except OSError:
+            pass
+
+    def entries(self):
+        ret = []
+        try:
+            with os.scandir(self.path) as it:
+                for e in it:
+                    if e.is_file() and len(e.name) == 40:
+                        st = e.stat()
+                        ret.append((st.st_mtime, st.st_size, e.path))
+        except OSError:
+            pass
+
+        return ret
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+            total -= size
+
+    def stats_path(self):
+        return join(self.path, 'stats.json')
+
+    def log_path(self):
+        return join(self.path, 'stats.log')
+
+    @staticmethod
+    def read_log(path):
+        try:
+            with open(path, 'rb') as f:
+                log = f.read()
+        except OSError:
+            log = b''
+
+        return {'hits': log.count(b'h'), 'misses': log.count(b'm')}
+
+    def stats(self):
+        import json
+
+        try:
+            with open(self.stats_path()) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+
+        log = self.read_log(self.log_path())
+        for field in ('hits', 'misses'):
+            stats[field] = stats.get(field, 0) + log[field]
+
+        return stats
+
+    def count(self, field):
+        r"""
+        Count a hit or a miss by appending one byte to the log, the stats are not read
+        """
+        try:
+            try:
+                f = open(self.log_path(), 'ab')
+            except FileNotFoundError:
+                os.makedirs(self.path, exist_ok=True)
+                f = open(self.log_path(), 'ab')
+
+            with f:
+                f.write(field[:1].encode('ascii'))
+
+        except OSError:
+            pass
+
+    def fold_stats(self):
+        r"""
+        Move the counts of the log into ``stats.json``
+        """
+        import json
+        import tempfile
+
+        # Runs appending meanwhile start a new log
+        log = '{}.{}'.format(self.log_path(), os.getpid())
+        try:
+            os.replace(self.log_path(), log)
+        except OSError:
+            return
+
+        try:
+            stats = self.stats()
+            counts = self.read_log(log)
+            for field in ('hits', 'misses'):
+                stats[field] += counts[field]
+
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with open(fd, 'w') as f:
+                json.dump(stats, f)
+
+            os.replace(tmp, self.stats_path())
+            os.unlink(log)
+        except OSError:
+            pass
+
+    def report(self):
+        stats = self.stats()
+        entries = self.entries()
+        lookups = stats['hits'] + stats['misses']
+        return '\n'.join([
+            'cache: {}'.format(self.path),
+            'entries: {}'.format(len(entries)),
+            'size: {} / {} bytes'.format(sum(size for _, size, _ in entries), self.max_size),
+            'hits: {}'.format(stats['hits']),
+            'misses: {}'.format(stats['misses']),
+            'hit rate: {:.1%}'.format(stats['hits'] / lookups if lookups else 0),
+            ])
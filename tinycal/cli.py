@@ -1,28 +1,36 @@
 """
 Define command line options
+
+The parser is built on first access of `parser`,
+invocations without arguments use `default_args()` and skip it entirely.
 """
 
+from collections import namedtuple
 from datetime import date
-from argparse import ArgumentParser, RawTextHelpFormatter, ArgumentTypeError, FileType
+from types import SimpleNamespace
 
 from . import CALRCS
 from . import __version__
 
 
-parser = ArgumentParser(
-    description='tinycal: A Python implementation of cal utility.',
-    prog='tcal',
-    epilog='Configuration files: {}'.format(CALRCS),
-    formatter_class=RawTextHelpFormatter,
-    )
-
-parser.add_argument('--version', '-v', action='version', version=__version__)
+def default_args():
+    r"""
+    Return the arguments of an invocation without arguments,
+    should be kept in sync with `build_parser()`
+    """
+    return SimpleNamespace(
+            col=None, after=None, before=None, a1b1=None, wk=None, wk_rule=None,
+            border=[], fill=None, color='auto', lang=None, start_monday=None,
+            cont=False, marks=None, serve=None, no_cache=False, cache_stats=False,
+            page_rows=None, sgr_coalesce=None, format='text', watch=False, profile=None, weeks=None,
+            today=None, year=None, month=None,
+            )
 
-parser.add_argument('--col', dest='col', default=None, type=int,
-                    help='Specify the column numbers.')
 
 def type_int_greater_than(limit):
     def int_greater_than(v):
+        from argparse import ArgumentTypeError
+
         ret = int(v)
         if ret <= limit:
             raise ArgumentTypeError('Should be greater than {}'.format(limit))
@@ -31,22 +39,11 @@ def type_int_greater_than(limit):
 
     return int_greater_than
 
-parser.add_argument('-A', dest='after', default=None, type=type_int_greater_than(-1),
-                    help='Display the number of months after the current month.')
-
-parser.add_argument('-B', dest='before', default=None, type=type_int_greater_than(-1),
-                    help='Display the number of months before the current month.')
-
-parser.add_argument('-3', action='store_true', dest='a1b1', default=None,
-                    help='Equals to -A 1 -B 1.')
-
-parser.add_argument('-w', '--wk', action='store_true', dest='wk', default=None,
-                    help='Display week number.')
-parser.add_argument('-W', '--no-wk', action='store_false', dest='wk', default=None,
-                    help='Don`t display week number.')
 
 border_choices = ('full', 'basic', 'off', 'ascii', 'single', 'bold', 'double', 'weld', 'noweld')
 def border_style_comma_separated_str(s):
+    from argparse import ArgumentTypeError
+
     res = []
     for i in s.strip().split(','):
         if i in border_choices:
@@ -57,57 +54,196 @@ def border_style_comma_separated_str(s):
 
     return res
 
-parser.add_argument('-b', '--border', type=border_style_comma_separated_str,
-                    default=[], const='full', nargs='?',
-                    help='Comma separated keywords to describe borders.\nValid keywords: '+ ','.join(border_choices))
 
-parser.add_argument('-f', '--fill', action='store_true', dest='fill', default=None,
-                    help='Fill every month into rectangle with previous/next month dates.')
-parser.add_argument('-F', '--no-fill', action='store_false', dest='fill', default=None,
-                    help='Don`t fill month into rectangle.')
+def full_date_str(today_str):
+    from argparse import ArgumentTypeError
 
-parser.add_argument('--color', choices=['never', 'always', 'auto'], type=str,
-                    default='auto', const='auto', nargs='?',
-                    help='Enable/disable VT100 color output.')
-parser.add_argument('-c', action='store_const', const='always', dest='color',
-                    help='Enable VT100 color output, equals to --color=always')
-parser.add_argument('-C', action='store_const', const='never', dest='color',
-                    help='Disable VT100 color output, equals to --color=never')
+    try:
+        return date(*map(int, today_str.split('/')))
+    except (TypeError, ValueError) as e:
+        raise ArgumentTypeError("format should be yyyy/mm/dd")
 
-parser.add_argument('-l', '--lang', choices=['jp', 'zh', 'en'], type=str,
-                    help='Select the language used to display weekdays and month names.')
 
-parser.add_argument('-j', action='store_const', const='jp', dest='lang',
-                    help='Equals to --lang=jp.')
+# A span of days in format ``yyyy/mm/dd..yyyy/mm/dd``, shown in contiguous mode
+DateSpan = namedtuple('DateSpan', ['first', 'last'])
 
-parser.add_argument('-z', action='store_const', const='zh', dest='lang',
-                    help='Equals to --lang=zh.')
 
-parser.add_argument('-e', action='store_const', const='en', dest='lang',
-                    help='Equals to --lang=en.')
+def year_or_range_str(s):
+    r"""
+    Accept a year, a range of months in format ``yyyy[/mm]..yyyy[/mm]``,
+    or a span of days in format ``yyyy/mm/dd..yyyy/mm/dd``
 
-parser.add_argument('-m', action='store_true', dest='start_monday', default=None,
-                    help='Use Monday as first weekday.')
-parser.add_argument('-M', action='store_false', dest='start_monday', default=None,
-                    help='Use Sunday as first weekday.')
+    >>> year_or_range_str('2020')
+    2020
+    >>> year_or_range_str('2020/03..2031')
+    (datetime.date(2020, 3, 1), datetime.date(2031, 12, 1))
+    >>> year_or_range_str('2020/03/10..2020/06/02')
+    DateSpan(first=datetime.date(2020, 3, 10), last=datetime.date(2020, 6, 2))
+    """
+    from argparse import ArgumentTypeError
 
-parser.add_argument('--cont', action='store_true', dest='cont', default=False,
-                    help='Show the calendar in contiguous mode.')
+    if '..' not in s:
+        return int(s)
 
-parser.add_argument('--marks', type=FileType('r'), dest='marks', default=None,
-                    help='Specify the date marking file.')
+    if s.count('/') == 4:
+        try:
+            span = DateSpan(*(full_date_str(part) for part in s.split('..')))
+        except (TypeError, ArgumentTypeError) as e:
+            raise ArgumentTypeError("format should be yyyy/mm/dd..yyyy/mm/dd")
+
+        if span.first > span.last:
+            raise ArgumentTypeError("range should not be reversed")
+
+        return span
+
+    def month_leading_date(part, default_month):
+        fields = part.split('/')
+        if len(fields) > 2:
+            raise ValueError(part)
+
+        return date(int(fields[0]), int(fields[1]) if len(fields) > 1 else default_month, 1)
 
-def full_date_str(today_str):
     try:
-        return date(*map(int, today_str.split('/')))
+        start, end = s.split('..')
+        start, end = month_leading_date(start, 1), month_leading_date(end, 12)
     except (TypeError, ValueError) as e:
-        raise ArgumentTypeError("format should be yyyy/mm/dd")
+        raise ArgumentTypeError("format should be yyyy[/mm]..yyyy[/mm] or yyyy/mm/dd..yyyy/mm/dd")
+
+    if start > end:
+        raise ArgumentTypeError("range should not be reversed")
+
+    return (start, end)
+
+
+def build_parser():
+    from argparse import ArgumentParser, RawTextHelpFormatter, FileType
+
+    parser = ArgumentParser(
+        description='tinycal: A Python implementation of cal utility.',
+        prog='tcal',
+        epilog='Configuration files: {}'.format(CALRCS),
+        formatter_class=RawTextHelpFormatter,
+        )
+
+    parser.add_argument('--version', '-v', action='version', version=__version__)
+
+    parser.add_argument('--col', dest='col', default=None, type=int,
+                        help='Specify the column numbers.')
+
+    parser.add_argument('-A', dest='after', default=None, type=type_int_greater_than(-1),
+                        help='Display the number of months after the current month.')
+
+    parser.add_argument('-B', dest='before', default=None, type=type_int_greater_than(-1),
+                        help='Display the number of months before the current month.')
+
+    parser.add_argument('-3', action='store_true', dest='a1b1', default=None,
+                        help='Equals to -A 1 -B 1.')
+
+    parser.add_argument('-w', '--wk', action='store_true', dest='wk', default=None,
+                        help='Display week number.')
+    parser.add_argument('-W', '--no-wk', action='store_false', dest='wk', default=None,
+                        help='Don`t display week number.')
+
+    parser.add_argument('--wk-rule', choices=['jan1', 'us', 'iso', 'full'], dest='wk_rule', default=None,
+                        help='Week numbering rule:\n'
+                             '  jan1: the week containing January 1st is week 1 (default)\n'
+                             '  us:   same as jan1, but weeks start on Sunday\n'
+                             '  iso:  ISO-8601, the week containing January 4th is week 1\n'
+                             '  full: the first full week is week 1')
+
+    parser.add_argument('-b', '--border', type=border_style_comma_separated_str,
+                        default=[], const='full', nargs='?',
+                        help='Comma separated keywords to describe borders.\nValid keywords: '+ ','.join(border_choices))
+
+    parser.add_argument('-f', '--fill', action='store_true', dest='fill', default=None,
+                        help='Fill every month into rectangle with previous/next month dates.')
+    parser.add_argument('-F', '--no-fill', action='store_false', dest='fill', default=None,
+                        help='Don`t fill month into rectangle.')
+
+    parser.add_argument('--color', choices=['never', 'always', 'auto'], type=str,
+                        default='auto', const='auto', nargs='?',
+                        help='Enable/disable VT100 color output.')
+    parser.add_argument('-c', action='store_const', const='always', dest='color',
+                        help='Enable VT100 color output, equals to --color=always')
+    parser.add_argument('-C', action='store_const', const='never', dest='color',
+                        help='Disable VT100 color output, equals to --color=never')
+
+    parser.add_argument('-l', '--lang', choices=['jp', 'zh', 'en'], type=str,
+                        help='Select the language used to display weekdays and month names.')
+
+    parser.add_argument('-j', action='store_const', const='jp', dest='lang',
+                        help='Equals to --lang=jp.')
+
+    parser.add_argument('-z', action='store_const', const='zh', dest='lang',
+                        help='Equals to --lang=zh.')
+
+    parser.add_argument('-e', action='store_const', const='en', dest='lang',
+                        help='Equals to --lang=en.')
+
+    parser.add_argument('-m', action='store_true', dest='start_monday', default=None,
+                        help='Use Monday as first weekday.')
+    parser.add_argument('-M', action='store_false', dest='start_monday', default=None,
+                        help='Use Sunday as first weekday.')
+
+    parser.add_argument('--cont', action='store_true', dest='cont', default=False,
+                        help='Show the calendar in contiguous mode.')
+
+    parser.add_argument('--weeks', dest='weeks', default=None, type=type_int_greater_than(0),
+                        help='Show WEEKS weeks in contiguous mode, starting from the current week\n'
+                             '(or the week of the 1st day of the given year / month).')
+
+    parser.add_argument('--marks', type=FileType('r'), dest='marks', default=None,
+                        help='Specify the date marking file.')
+
+    parser.add_argument('--serve', nargs='?', const='', default=None, metavar='SOCKET',
+                        help='Run as a resident server on the Unix socket, for `tcal-client`.')
+
+    parser.add_argument('--no-cache', action='store_true', dest='no_cache', default=False,
+                        help='Bypass the render cache (enabled by TINYCAL_CACHE).')
+
+    parser.add_argument('--cache-stats', action='store_true', dest='cache_stats', default=False,
+                        help='Show render cache statistics and exit.')
+
+    parser.add_argument('--today', type=full_date_str, default=None,
+                        help='Date that treated as today in format yyyy/mm/dd, used for debugging.')
+
+    parser.add_argument('--page-rows', dest='page_rows', default=None, type=type_int_greater_than(0),
+                        help='Insert page breaks (form feeds) between rows of months,\n'
+                             'so every page has at most PAGE_ROWS lines.')
+
+    parser.add_argument('--sgr-coalesce', action='store_true', dest='sgr_coalesce', default=None,
+                        help='Emit only the changes of colors, shrinks colored output.')
+
+    parser.add_argument('--format', choices=['text', 'json'], default='text',
+                        help='Output format, json prints the grid of months, weeks and days\n'
+                             'without colors and borders.')
+
+    parser.add_argument('--watch', action='store_true', dest='watch', default=False,
+                        help='Stay resident, repaint the calendar at midnight\n'
+                             'or when the configuration or date marking file changes.')
+
+    parser.add_argument('--profile', nargs='?', const='-', default=None, metavar='FILE',
+                        help='Record per-phase durations and counters as JSON,\n'
+                             'to stderr or appended to FILE (also enabled by TINYCAL_PROFILE).')
+
+    parser.add_argument('year', type=year_or_range_str, nargs='?', default=None,
+                        help='Year to display, range of months to display in format yyyy[/mm]..yyyy[/mm],\n'
+                             'or span of days to display in contiguous mode in format yyyy/mm/dd..yyyy/mm/dd.')
+
+    parser.add_argument('month', type=int, nargs='?', default=None,
+                        help='Month to display. Must specified after year.')
+
+    return parser
+
+
+_parser = None
 
-parser.add_argument('--today', type=full_date_str, default=None,
-                    help='Date that treated as today in format yyyy/mm/dd, used for debugging.')
+def __getattr__(name):
+    global _parser
+    if name == 'parser':
+        if _parser is None:
+            _parser = build_parser()
 
-parser.add_argument('year', type=int, nargs='?', default=None,
-                    help='Year to display.')
+        return _parser
 
-parser.add_argument('month', type=int, nargs='?', default=None,
-                    help='Month to display. Must specified after year.')
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
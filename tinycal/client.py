@@ -0,0 +1,64 @@
+"""
+Thin client of `tcal --serve`
+
+Forwards the command line arguments to the resident server and prints the reply,
+falls back to in-process rendering if the server is not running.
+"""
+
+import json
+import os
+import socket
+import sys
+
+
+def socket_path():
+    if os.environ.get('TINYCAL_SOCKET'):
+        return os.environ['TINYCAL_SOCKET']
+
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'tinycal.sock')
+
+    return '/tmp/tinycal-{}.sock'.format(os.getuid())
+
+
+def request(path, argv, isatty=False):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps({
+            'argv': argv,
+            'isatty': isatty,
+            'cwd': os.getcwd(),
+            'env': {k: v for k, v in os.environ.items() if k.startswith('TINYCAL_')},
+            }).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    finally:
+        sock.close()
+
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def main():
+    argv = sys.argv[1:]
+    try:
+        reply = request(socket_path(), argv, sys.stdout.isatty())
+    except (OSError, ValueError):
+        from . import tcal
+        return tcal.main(argv)
+
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    sys.exit(reply['status'])
+
+
+if __name__ == '__main__':
+    main()
@@ -24,13 +24,12 @@ Color('BLACK:None')
 Color('None:white')
 """
 
-import configparser
-import re
+import os
 
-from os.path import expanduser, exists
+from os.path import expanduser, exists, join
 
 from .declarative_config import (
-        ValueField, ValidationError,
+        Config, ValueField, ValidationError,
         IntegerField, BoolField, SelectorField,
         )
 
@@ -43,29 +42,125 @@ def greater_than(n):
 
 
 class Color:
+    r"""
+    Immutable color value, instances are interned,
+    so equal colors are the same object and the escape sequences are computed only once
+
+    >>> Color('RED') is Color('RED:none')
+    True
+    >>> Color('red').fg = 'blue'
+    Traceback (most recent call last):
+      ...
+    AttributeError: Color is immutable
+    """
+    __slots__ = ('highlight', 'fg', 'bg', 'code', 'reset')
+
     definition = {
             'black': '0', 'red': '1', 'green': '2', 'yellow': '3',
             'blue': '4', 'magenta': '5', 'cyan': '6', 'white': '7',
             }
-    patt = re.compile(r'^\s*(?P<fg>\w+)?\s*:?(?:\s*(?P<bg>\w+)\s*)?$')
 
-    assert patt.match('').groups() == (None, None)
-    assert patt.match('a').groups() == ('a', None)
-    assert patt.match('a:').groups() == ('a', None)
-    assert patt.match(':b').groups() == (None, 'b')
-    assert patt.match('a:b').groups() == ('a', 'b')
+    # color setting -> Color, and (highlight, fg, bg) -> Color
+    _settings = {}
+    _values = {}
+
+    @staticmethod
+    def split(color_setting):
+        r"""
+        Split color setting into (fg, bg), equivalent to regex
+        ``^\s*(?P<fg>\w+)?\s*:?(?:\s*(?P<bg>\w+)\s*)?$``
+        but without importing `re` module
+
+        >>> Color.split('')
+        (None, None)
+        >>> Color.split('a')
+        ('a', None)
+        >>> Color.split('a:')
+        ('a', None)
+        >>> Color.split(':b')
+        (None, 'b')
+        >>> Color.split('a:b')
+        ('a', 'b')
+        >>> Color.split('a:b:c') is None
+        True
+        """
+        parts = color_setting.split(':')
+        if len(parts) == 1:
+            parts = parts[0].split()
+            if len(parts) > 2:
+                return None
+        elif len(parts) == 2:
+            parts = [p.strip() for p in parts]
+        else:
+            return None
+
+        if not all(p.replace('_', 'a').isalnum() for p in parts if p):
+            return None
+
+        fg, bg = (parts + ['', ''])[:2]
+        return (fg or None, bg or None)
 
-    def __init__(self, color_setting):
+    def __new__(cls, color_setting):
         r"""
         >>> Color('red:red:red')
         Traceback (most recent call last):
-          ....
-        ValueError
+          ...
+        ValueError: red:red:red does not match color setting pattern
         """
-        m = self.patt.match(color_setting)
+        try:
+            return cls._settings[color_setting]
+        except KeyError:
+            pass
+
+        m = cls.split(color_setting)
         if m is None:
-            raise ValueError('{} does not match color setting pattern'.format(text))
-        self.highlight, self.fg, self.bg = self.clean(*m.groups())
+            raise ValueError('{} does not match color setting pattern'.format(color_setting))
+
+        color = cls._intern(*cls.clean(*m))
+        cls._settings[color_setting] = color
+        return color
+
+    @classmethod
+    def _intern(cls, highlight, fg, bg):
+        try:
+            return cls._values[(highlight, fg, bg)]
+        except KeyError:
+            pass
+
+        color = object.__new__(cls)
+        setattr_ = super(Color, color).__setattr__
+        setattr_('highlight', highlight)
+        setattr_('fg', fg)
+        setattr_('bg', bg)
+
+        fgcode = lambda c: '3%s' % cls.definition[c.lower()]
+        bgcode = lambda c: '4%s' % cls.definition[c]
+        code = lambda *t: '\033[%sm' % ";".join(t)
+
+        if fg is None:
+            if bg is None:
+                setattr_('code', '')
+            elif bg == 'white':
+                setattr_('code', code('0', fgcode('black'), bgcode('white')))  # reverse
+            else:
+                setattr_('code', code(bgcode(bg)))  # keep foreground setting
+        else:
+            bright = '%i' % highlight
+            if bg is None:
+                setattr_('code', code(bright, fgcode(fg)))  # keep background setting
+            else:
+                setattr_('code', code(bright, fgcode(fg), bgcode(bg)))
+
+        setattr_('reset', '\033[0m' if color.code else '')
+
+        cls._values[(highlight, fg, bg)] = color
+        return color
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Color is immutable')
+
+    def __reduce__(self):
+        return (self.__class__, (self.__str__(),))
 
     def upper(self):
         if str(self) == 'BLACK:none':
@@ -79,7 +174,8 @@ class Color:
         # use `__len__` instead of `__bool__` for Python 2/3 compatible
         return False if self.fg == self.bg == None else True
 
-    def clean(self, fg, bg):
+    @classmethod
+    def clean(cls, fg, bg):
         r"""
         >>> Color('Apua')
         Traceback (most recent call last):
@@ -97,9 +193,9 @@ class Color:
         else:
             bg_ = bg.lower()
 
-        if fg_ is not None and fg_ not in self.definition:
+        if fg_ is not None and fg_ not in cls.definition:
             raise ValueError('unrecognized foreground color: {}'.format(fg))
-        elif bg_ is not None and bg_ not in self.definition:
+        elif bg_ is not None and bg_ not in cls.definition:
             raise ValueError('unrecognized background color: {}'.format(bg))
 
         return highlight, fg_, bg_
@@ -124,17 +220,14 @@ class Color:
 
         fg_color = self if new.fg is None else new
         bg_color = self if new.bg is None else new
-        color = Color('')
-        color.highlight, color.fg = fg_color.highlight, fg_color.fg
-        color.bg = bg_color.bg
-        return color
+        return self._intern(fg_color.highlight, fg_color.fg, bg_color.bg)
 
     def __repr__(self):
         r"""
         >>> Color('BLACK')
-        Color('BLACK:None')
+        Color('BLACK:none')
         >>> Color('')
-        Color('None:None')
+        Color('none:none')
         """
         return "%s('%s')" % (self.__class__.__name__, self.__str__())
 
@@ -153,32 +246,10 @@ class Color:
         >>> Color('black:white')(' * ')
         '\x1b[0;30;47m * \x1b[0m'
         """
-        code = self.code
-        reset = '\033[0m'
-        if code:
-            return '%s%s%s' % (code, item, reset)
-        else:
-            return '%s' % item
-
-    @property
-    def code(self):
-        fgcode = lambda c: '3%s' % self.definition[c.lower()]
-        bgcode = lambda c: '4%s' % self.definition[c]
-        code = lambda *t: '\033[%sm' % ";".join(t)
+        if self.code:
+            return '%s%s%s' % (self.code, item, self.reset)
 
-        if self.fg is None:
-            if self.bg is None:
-                return ''
-            elif self.bg == 'white':
-                return code('0', fgcode('black'), bgcode('white'))  # reverse
-            else:
-                return code(bgcode(self.bg))  # keep foreground setting
-        else:
-            bright = '%i' % self.highlight
-            if self.bg is None:
-                return code(bright, fgcode(self.fg))  # keep background setting
-            else:
-                return code(bright, fgcode(self.fg), bgcode(self.bg))
+        return '%s' % item
 
 
 class ColorField(ValueField):
@@ -189,11 +260,12 @@ class ColorField(ValueField):
         return Color(text)
 
 
-class TinyCalConfig:
+class TinyCalConfig(Config):
     col = IntegerField(default=3, limiters=[greater_than(0)])
     after = IntegerField(default=0, limiters=[greater_than(-1)])
     before = IntegerField(default=0, limiters=[greater_than(-1)])
     wk = BoolField(default=False)
+    wk_rule = SelectorField(['jan1', 'us', 'iso', 'full'], default='jan1')
     fill = BoolField(default=False)
     border = SelectorField(['true', 'full', 'basic', 'off', 'false'], default='full')
     border_style = SelectorField(['ascii', 'single', 'bold', 'double'], default='single')
@@ -201,6 +273,9 @@ class TinyCalConfig:
     start_monday = BoolField(default=False)
     lang = SelectorField(['zh', 'jp', 'en'], default='en')
     marks = ValueField(default=None)
+    marks_categories = ValueField(default=None)
+    sgr_coalesce = BoolField(default=False)
+    engine = SelectorField(['python', 'numpy'], default='python')
 
     color_border = ColorField(default=Color('none:none'))
     color_wk = ColorField(default=Color('BLACK'))
@@ -222,50 +297,165 @@ class TinyCalConfig:
     color_friday = ColorField(default=Color('none:none'))
     color_saturday = ColorField(default=Color('none:none'))
     color_today = ColorField(default=Color('none:white'))
-    color_today_wk = ColorField(default=Color('none:none'))
+    color_today_wk = ColorField(default=None)
 
-    def __init__(self, attrs):
-        assert isinstance(attrs, dict)
-        assert all(isinstance(k, str) and isinstance(v, str) for k,v in attrs.items())
+    @staticmethod
+    def field_name(key):
+        r"""
+        >>> TinyCalConfig.field_name('today.wk.color'), TinyCalConfig.field_name('border.style')
+        ('color_today_wk', 'border_style')
+        """
+        if key.endswith('.color'):
+            return '_'.join(['color'] + key.split('.')[:-1])
 
-        tmp = {}
-        for k, v in attrs.items():
-            if k.endswith('.color'):
-                tmp[ '_'.join(['color'] + k.split('.')[:-1]) ] = v
-            else:
-                tmp['_'.join(k.split('.'))] = v
+        return '_'.join(key.split('.'))
+
+    @classmethod
+    def env_overrides(cls, environ):
+        r"""
+        Return the ``TINYCAL_<FIELD>`` variables of ``environ``, as ``{field name: value}``
 
-        attrs = tmp
+        >>> TinyCalConfig.env_overrides({'TINYCAL_COLOR_TODAY': 'red', 'TINYCAL_CACHE': '1'})
+        {'color_today': 'red'}
+        """
+        return {name: environ['TINYCAL_' + name.upper()]
+                for name in cls.fields() if 'TINYCAL_' + name.upper() in environ}
+
+    @classmethod
+    def parse_conf(cls, calrcs, environ=None):
+        r"""
+        Parse and merge the configuration sources (paths, dicts or file objects),
+        the former ones override the latter ones, missing files are skipped.
+        The ``TINYCAL_<FIELD>`` variables of ``environ`` override all of them.
+        """
+        attrs = {}
+        for rc in reversed(calrcs):
+            attrs.update((cls.field_name(k), v) for k, v in (read_calrc(rc) or {}).items())
 
-        for name, field in vars(self.__class__).items():
-            if isinstance(field, ValueField):
-                setattr(self, name, field.clean(name, attrs.get(name)))
+        if environ is not None:
+            attrs.update(cls.env_overrides(environ))
+
+        return cls(attrs)
 
     @classmethod
-    def parse_conf(cls, calrcs):
-        for rc in calrcs:
-            if isinstance(rc, str):
-                rc = expanduser(rc)
-                if not exists(rc):
-                    continue
-
-                with open(rc) as f:
-                    content = '[_]\n' + f.read()
-                    c = configparser.ConfigParser()
-                    c.read_string(content)
-                    return cls(dict(c['_']))
-
-            elif isinstance(rc, dict):
-                return cls(rc)
-
-            elif callable(getattr(rc, 'read', None)):
-                content = '[_]\n' + rc.read()
-                c = configparser.ConfigParser()
-                c.read_string(content)
-                return cls(dict(c['_']))
+    def load(cls, calrcs, environ=None, snapshot=None):
+        r"""
+        Same as ``parse_conf()``, but the merged configuration is cached in ``snapshot`` file,
+        keyed on the modification times of the files and the environment overrides.
+        A valid snapshot is loaded without parsing and validating again.
 
-            else:
-                raise TypeError('Dont know how to handle', rc)
+        Only configuration files (paths) are cacheable.
+        Without ``snapshot``, the snapshot is kept in the cache directory,
+        only if caching is enabled by ``TINYCAL_CACHE``, see `cache`.
+        """
+        if not all(isinstance(rc, str) for rc in calrcs):
+            return cls.parse_conf(calrcs, environ)
+
+        if snapshot is None:
+            from .cache import enabled_cache_dir
+            path = enabled_cache_dir()
+            if path is None:
+                return cls.parse_conf(calrcs, environ)
+
+            snapshot = join(path, 'config.snapshot')
+
+        import marshal
+        from . import __version__
+
+        key = (
+                __version__,
+                tuple((rc, file_stamp(expanduser(rc))) for rc in calrcs),
+                tuple(sorted(cls.env_overrides(environ or {}).items())),
+                )
+
+        try:
+            with open(snapshot, 'rb') as f:
+                data = marshal.load(f)
+            if data['key'] == key:
+                return cls.from_snapshot(data['values'])
+
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass
+
+        conf = cls.parse_conf(calrcs, environ)
+        try:
+            import tempfile
+
+            os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(snapshot), prefix='config.', suffix='.tmp')
+            try:
+                with open(fd, 'wb') as f:
+                    marshal.dump({'key': key, 'values': conf.to_snapshot()}, f)
+
+                os.replace(tmp, snapshot)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+        except OSError:
+            pass
+
+        return conf
+
+    def to_snapshot(self):
+        r"""
+        Return the values as a dict of built-in types, Colors are stored as color settings
+        """
+        return {name: (str(getattr(self, name)) if isinstance(getattr(self, name), Color) else getattr(self, name))
+                for name in self.fields()}
+
+    @classmethod
+    def from_snapshot(cls, values):
+        r"""
+        Restore the values returned by ``to_snapshot()``, they are trusted and not validated again
+
+        >>> conf = TinyCalConfig({'wk': 'true', 'today.color': 'RED'})
+        >>> restored = TinyCalConfig.from_snapshot(conf.to_snapshot())
+        >>> restored.wk, restored.color_today is conf.color_today
+        (True, True)
+        """
+        conf = cls.__new__(cls)
+        for name, field in cls.fields().items():
+            value = values[name]
+            if isinstance(field, ColorField) and value is not None:
+                value = Color(value)
+
+            setattr(conf, name, value)
+
+        return conf
+
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def read_calrc(rc):
+    r"""
+    Return the key-value pairs of a configuration source (path, dict or file object),
+    or None if the file does not exist
+    """
+    if isinstance(rc, str):
+        rc = expanduser(rc)
+        if not exists(rc):
+            return None
+
+        with open(rc) as f:
+            content = f.read()
+
+    elif isinstance(rc, dict):
+        return rc
+
+    elif callable(getattr(rc, 'read', None)):
+        content = rc.read()
 
+    else:
+        raise TypeError('Dont know how to handle', rc)
 
-        return cls({})
+    import configparser
+    c = configparser.ConfigParser()
+    c.read_string('[_]\n' + content)
+    return dict(c['_'])
@@ -40,15 +40,19 @@ class ValidationError(Exception): pass
 
 
 class ValueField(object):
-    def __new__(cls, *args, **kwargs):
-        kwarg_count = 0 if cls.__init__.__defaults__ is None else len(cls.__init__.__defaults__)
-        arg_count = cls.__init__.__code__.co_argcount - 1 - kwarg_count
-        assert len(args) == arg_count
-        return super(ValueField, cls).__new__(cls)
-
-    def __init__(self, default=None, limiters=()):
+    def __init__(self, default=None, limiters=(), key=None):
         self.default = default
         self.limiters = limiters
+        self.key = key
+
+    def config_key(self, name):
+        r"""
+        Return the key of the field named ``name`` in configuration
+        """
+        if self.key is None:
+            return name
+
+        return self.key(name) if callable(self.key) else self.key
 
     def to_python(self, text):
         return text
@@ -76,6 +80,85 @@ class ValueField(object):
         return value
 
 
+class ConfigMeta(type):
+    r"""
+    Compile the fields of a Config class once, at class creation
+
+    The fields are moved into ``_fields``, and the instances store the values in ``__slots__``.
+    """
+    def __new__(mcs, name, bases, namespace):
+        fields = {}
+        for base in reversed(bases):
+            fields.update(getattr(base, '_fields', {}))
+
+        own = [k for k, v in namespace.items() if isinstance(v, ValueField)]
+        for k in own:
+            fields[k] = namespace.pop(k)
+
+        namespace['__slots__'] = tuple(k for k in own if k not in namespace.get('__slots__', ()))
+        namespace['_fields'] = fields
+
+        # config key -> field name, unknown keys are resolved by `field_name()` on first sight
+        namespace['_keys'] = {field.config_key(k): k for k, field in fields.items()}
+
+        return super(ConfigMeta, mcs).__new__(mcs, name, bases, namespace)
+
+
+class Config(metaclass=ConfigMeta):
+    __slots__ = ()
+
+    def __init__(self, attrs):
+        assert isinstance(attrs, dict)
+        assert all(isinstance(k, str) and isinstance(v, str) for k,v in attrs.items())
+
+        fields = self._fields
+        keys = self._keys
+        texts = {}
+        for k, v in attrs.items():
+            try:
+                name = keys[k]
+            except KeyError:
+                # Fields with explicit keys are not reachable by their names
+                name = self.field_name(k)
+                name = keys[k] = name if name in fields and fields[name].key is None else None
+
+            if name is not None:
+                texts[name] = v
+
+        setattr_ = object.__setattr__
+        for name, field in fields.items():
+            text = texts.get(name)
+            setattr_(self, name, field.default if text is None else field.clean(name, text))
+
+    @staticmethod
+    def field_name(key):
+        r"""
+        Return the field name of an unknown configuration key, override it to accept aliases
+        """
+        return key
+
+    @classmethod
+    def fields(cls):
+        return cls._fields
+
+    def replace(self, **overrides):
+        r"""
+        Return a copy with the given values replaced, the values are not validated
+        """
+        ret = self.__class__.__new__(self.__class__)
+        for name in self._fields:
+            setattr(ret, name, overrides[name] if name in overrides else getattr(self, name))
+
+        return ret
+
+    def __copy__(self):
+        return self.replace()
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__,
+                ','.join('{}={}'.format(name, getattr(self, name)) for name in self._fields))
+
+
 class IntegerField(ValueField):
     def to_python(self, text):
         try:
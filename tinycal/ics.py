@@ -0,0 +1,388 @@
+"""
+iCalendar (.ics) date marking files
+
+The events of a ``.ics`` file are translated into lines of the date marking file format,
+so they go through the same parser and are cached in the same index, see `marks`.
+The file is streamed: one event is kept in memory at a time.
+
+- An event of one day becomes a date, an event of several days becomes a range
+- Recurring events (``RRULE``) become recurrence rules within the range of the recurrence,
+  the end of a ``COUNT`` limited recurrence is calculated once when the index is built,
+  daily, weekly and monthly recurrences limited by ``BYMONTH`` become yearly rules
+- ``EXDATE`` dates are left out of the recurrence, ``RDATE`` dates are added to it,
+  cancelled events (``STATUS:CANCELLED``) are skipped
+- The color comes from the ``CATEGORIES`` of the event, mapped by ``marks.categories``,
+  e.g. ``Holiday=RED, Team meeting=blue:white, *=YELLOW``,
+  ``*`` is the color of the events without a mapped category (default: ``RED``)
+
+Unsupported events (``INTERVAL`` > 1, ``BYSETPOS``, recurring events of several days,
+``RDATE`` periods ...) are skipped and counted as invalid lines. Times and time zones are ignored, only the dates are used.
+"""
+
+import heapq
+
+from datetime import date, timedelta
+from itertools import groupby, islice
+
+from .layout import month_length
+from .marks import MarkRule, weekday_names
+
+DEFAULT_COLOR = 'RED'
+
+ics_weekdays = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+nth_words = {1: '1st', 2: '2nd', 3: '3rd', 4: '4th', 5: '5th', -1: 'last'}
+
+
+def parse_categories(setting):
+    r"""
+    Parse ``marks.categories`` into a ``{category (lower case): color setting}`` dict
+
+    >>> sorted(parse_categories('Holiday=RED, Team meeting = blue:white').items())
+    [('holiday', 'RED'), ('team meeting', 'blue:white')]
+    """
+    ret = {}
+    for item in (setting or '').split(','):
+        name, sep, color = item.partition('=')
+        if sep:
+            ret[name.strip().lower()] = color.strip()
+
+    return ret
+
+
+def unfold(lines):
+    r"""
+    Join the folded content lines
+
+    >>> list(unfold(['SUMMARY:a\r\n', ' b\r\n', 'END:VEVENT']))
+    ['SUMMARY:ab', 'END:VEVENT']
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+
+        if current is not None:
+            yield current
+
+        current = line
+
+    if current:
+        yield current
+
+
+def parse_line(line):
+    r"""
+    Split a content line into (name, {parameter: value}, value)
+
+    >>> parse_line('DTSTART;VALUE=DATE:20201225')
+    ('DTSTART', {'VALUE': 'DATE'}, '20201225')
+    >>> parse_line('DTSTART;TZID="Asia/Taipei":20201225T090000')
+    ('DTSTART', {'TZID': 'Asia/Taipei'}, '20201225T090000')
+    """
+    quoted = False
+    for idx, c in enumerate(line):
+        if c == '"':
+            quoted = not quoted
+        elif c == ':' and not quoted:
+            break
+    else:
+        return line.upper(), {}, ''
+
+    name, *params = line[:idx].split(';')
+    params = dict(p.partition('=')[::2] for p in params)
+    return name.upper(), {k.upper(): v.strip('"') for k, v in params.items()}, line[idx + 1:]
+
+
+def iter_events(lines):
+    r"""
+    Iterate over the events of an iCalendar stream, as ``{property name: [(parameters, value)]}`` dicts
+
+    The properties of the components nested in the events (e.g. alarms) are skipped.
+    """
+    event = None
+    depth = 0
+    for line in unfold(lines):
+        name, params, value = parse_line(line)
+        if name == 'BEGIN':
+            if event is None and value.upper() == 'VEVENT':
+                event = {}
+            elif event is not None:
+                depth += 1
+
+        elif name == 'END' and event is not None:
+            if depth:
+                depth -= 1
+            elif value.upper() == 'VEVENT':
+                yield event
+                event = None
+
+        elif event is not None and not depth:
+            event.setdefault(name, []).append((params, value))
+
+
+def parse_date(value):
+    r"""
+    Return the date of a DATE or DATE-TIME value
+
+    >>> parse_date('20201225'), parse_date('20201225T090000Z')
+    (datetime.date(2020, 12, 25), datetime.date(2020, 12, 25))
+    """
+    return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+
+def event_color(event, categories):
+    for params, value in event.get('CATEGORIES', []):
+        for category in value.split(','):
+            color = categories.get(category.strip().lower())
+            if color:
+                return color
+
+    return categories.get('*', DEFAULT_COLOR)
+
+
+def event_end(event, start):
+    r"""
+    Return the last day of an event
+    """
+    if 'DTEND' in event:
+        value = event['DTEND'][0][1]
+        end = parse_date(value)
+        # The end is exclusive, unless it's in the middle of the day
+        if len(value) == 8 or value[9:15] in ('', '000000'):
+            end -= timedelta(days=1)
+
+        return max(start, end)
+
+    if 'DURATION' in event:
+        value = event['DURATION'][0][1].upper()
+        for unit, days in (('W', 7), ('D', 1)):
+            if value.startswith('P') and value.endswith(unit) and value[1:-1].isdigit():
+                return max(start, start + timedelta(days=int(value[1:-1]) * days - 1))
+
+    return start
+
+
+def parse_byday(item):
+    r"""
+    Return (nth or None, weekday name) of a ``BYDAY`` item
+
+    >>> parse_byday('-1FR'), parse_byday('MO')
+    ((-1, 'fri'), (None, 'mon'))
+    """
+    code = item[-2:].upper()
+    if code not in ics_weekdays:
+        raise ValueError(item)
+
+    nth = int(item[:-2]) if item[:-2] else None
+    if nth is not None and nth not in nth_words:
+        raise ValueError(item)
+
+    return nth, weekday_names[ics_weekdays.index(code)][:3]
+
+
+def in_months(rule, months):
+    r"""
+    Restrict a daily, weekly or monthly recurrence rule to the given months (``BYMONTH``),
+    return the equivalent yearly rules
+
+    >>> in_months('weekly mon', [6])
+    ['yearly 06 1st mon', 'yearly 06 2nd mon', 'yearly 06 3rd mon', 'yearly 06 4th mon', 'yearly 06 5th mon']
+    >>> in_months('monthly 31', [2, 3])
+    ['yearly 03/31']
+    """
+    freq, _, spec = rule.partition(' ')
+    rules = []
+    for month in months:
+        # 2000 is a leap year, yearly 02/29 only occurs in leap years
+        length = month_length(2000, month)
+        if not freq:
+            rules.extend('yearly {:02}/{:02}'.format(month, day) for day in range(1, length + 1))
+        elif freq == 'weekly':
+            rules.extend('yearly {:02} {} {}'.format(month, nth_words[nth], spec) for nth in range(1, 6))
+        elif spec.isdigit():
+            if int(spec) <= length:
+                rules.append('yearly {:02}/{:02}'.format(month, int(spec)))
+        else:
+            rules.append('yearly {:02} {}'.format(month, spec))
+
+    return rules
+
+
+def recurrence_rules(rrule, start):
+    r"""
+    Translate ``RRULE`` into recurrence rules of the date marking file format,
+    return (rules, until date or None, count or None)
+
+    >>> recurrence_rules('FREQ=YEARLY;BYMONTH=11;BYDAY=4TH', date(2020, 11, 26))
+    (['yearly 11 4th thu'], None, None)
+    >>> recurrence_rules('FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20210131', date(2021, 1, 4))
+    (['weekly mon', 'weekly wed'], datetime.date(2021, 1, 31), None)
+    >>> recurrence_rules('FREQ=MONTHLY;BYMONTH=6,12;BYDAY=-1FR', date(2021, 6, 25))
+    (['yearly 06 last fri', 'yearly 12 last fri'], None, None)
+    """
+    parts = dict(p.partition('=')[::2] for p in rrule.upper().split(';') if p)
+    freq = parts.pop('FREQ', None)
+    until = parse_date(parts.pop('UNTIL')) if 'UNTIL' in parts else None
+    count = int(parts.pop('COUNT')) if 'COUNT' in parts else None
+    if parts.pop('INTERVAL', '1') != '1':
+        raise ValueError(rrule)
+
+    parts.pop('WKST', None)
+    bydays = [parse_byday(item) for item in parts.pop('BYDAY').split(',')] if 'BYDAY' in parts else []
+    monthdays = [int(d) for d in parts.pop('BYMONTHDAY').split(',')] if 'BYMONTHDAY' in parts else []
+    months = [int(m) for m in parts.pop('BYMONTH').split(',')] if 'BYMONTH' in parts else None
+    if parts or any(d < 1 for d in monthdays) or (bydays and monthdays):
+        raise ValueError(rrule)
+
+    weekday = weekday_names[start.weekday()][:3]
+    if freq == 'DAILY' and not bydays and not monthdays:
+        rules = ['']
+
+    elif freq == 'WEEKLY' and not monthdays and all(nth is None for nth, _ in bydays):
+        rules = ['weekly ' + wd for _, wd in bydays or [(None, weekday)]]
+
+    elif freq == 'MONTHLY':
+        if bydays:
+            rules = ['monthly {} {}'.format(nth_words[nth], wd) if nth else 'weekly ' + wd for nth, wd in bydays]
+        else:
+            rules = ['monthly {}'.format(d) for d in monthdays or [start.day]]
+
+    elif freq == 'YEARLY':
+        months = months or [start.month]
+        if bydays and all(nth for nth, _ in bydays):
+            rules = ['yearly {:02} {} {}'.format(m, nth_words[nth], wd) for m in months for nth, wd in bydays]
+        elif not bydays:
+            rules = ['yearly {:02}/{:02}'.format(m, d) for m in months for d in monthdays or [start.day]]
+        else:
+            raise ValueError(rrule)
+
+    else:
+        raise ValueError(rrule)
+
+    if months and freq != 'YEARLY':
+        rules = [r for rule in rules for r in in_months(rule, months)]
+
+    return rules, until, count
+
+
+def mark_line(first, last, rule, color):
+    return '{}..{} {}{}'.format(first.strftime('%Y/%m/%d'), last.strftime('%Y/%m/%d'),
+                                rule + ' ' if rule else '', color)
+
+
+def date_values(event, name):
+    r"""
+    Return the dates of the DATE or DATE-TIME values of all ``name`` properties (e.g. ``EXDATE``)
+    """
+    ret = []
+    for params, value in event.get(name, []):
+        if params.get('VALUE', 'DATE').upper() not in ('DATE', 'DATE-TIME'):
+            # PERIOD values
+            raise ValueError(value)
+
+        ret.extend(parse_date(v) for v in value.split(',') if v)
+
+    return ret
+
+
+def windows(first, last, excluded):
+    r"""
+    Split range [first, last] into the ranges between the ``excluded`` dates
+
+    >>> list(windows(date(2021, 1, 1), date(2021, 1, 31), [date(2021, 1, 10), date(2021, 1, 31)]))
+    [(datetime.date(2021, 1, 1), datetime.date(2021, 1, 9)), (datetime.date(2021, 1, 11), datetime.date(2021, 1, 30))]
+    """
+    first, last = first.toordinal(), last.toordinal()
+    for day in sorted(set(d.toordinal() for d in excluded)):
+        if first <= day <= last:
+            if first < day:
+                yield date.fromordinal(first), date.fromordinal(day - 1)
+
+            first = day + 1
+
+    if first <= last:
+        yield date.fromordinal(first), date.fromordinal(last)
+
+
+class EventMarkLines:
+    r"""
+    The lines of the date marking file format of the events of an iCalendar stream
+
+    The unsupported events are skipped and counted in ``invalid``, see `marks.MarksIndex.parse`.
+    """
+
+    def __init__(self, lines, categories=None):
+        self.lines = lines
+        self.categories = categories or {}
+        self.invalid = 0
+
+    def __iter__(self):
+        self.invalid = 0
+        for event in iter_events(self.lines):
+            try:
+                if event.get('STATUS', [({}, '')])[0][1].upper() == 'CANCELLED':
+                    continue
+
+                # Translated first, so an unsupported event yields no lines
+                lines = list(self.event_lines(event))
+            except (KeyError, ValueError, IndexError, OverflowError):
+                self.invalid += 1
+                continue
+
+            yield from lines
+
+    def event_lines(self, event):
+        start = parse_date(event['DTSTART'][0][1])
+        end = event_end(event, start)
+        color = event_color(event, self.categories)
+        excluded = date_values(event, 'EXDATE')
+        # Ranges of one day, so they keep the order of the events like the rules
+        extra = [mark_line(day, day, '', color) for day in date_values(event, 'RDATE') if day not in excluded]
+        if 'RRULE' not in event:
+            if (extra or excluded) and start != end:
+                raise ValueError('extra dates of an event of several days')
+
+            if start in excluded:
+                pass
+            elif start == end:
+                yield '{} {}'.format(start.strftime('%Y/%m/%d'), color)
+            else:
+                yield mark_line(start, end, '', color)
+
+            yield from extra
+            return
+
+        if start != end:
+            raise ValueError('recurring event of several days')
+
+        rules, until, count = recurrence_rules(event['RRULE'][0][1], start)
+        last = until or date.max
+        if count is not None:
+            # The expansion window ends at the last occurrence,
+            # the rules may share occurrences, which are counted once
+            parsed = [MarkRule.parse(mark_line(start, last, rule, color)) for rule in rules]
+            occurrences = (day for day, _ in groupby(heapq.merge(*(r.occurrences(r.first, r.last) for r in parsed))))
+            ordinals = list(islice(occurrences, count))
+            last = date.fromordinal(ordinals[-1]) if ordinals else start
+
+        # The excluded occurrences are left out of the windows of the rules
+        for first, window_last in windows(start, last, excluded):
+            for rule in rules:
+                yield mark_line(first, window_last, rule, color)
+
+        yield from extra
+
+
+def mark_lines(lines, categories=None):
+    r"""
+    Translate the events of an iCalendar stream into lines of the date marking file format,
+    the number of unsupported events is in the ``invalid`` attribute of the returned iterable
+
+    >>> list(mark_lines(['BEGIN:VEVENT', 'DTSTART;VALUE=DATE:20201225', 'CATEGORIES:Holiday', 'END:VEVENT',
+    ...                  'BEGIN:VEVENT', 'DTSTART:20210104T090000', 'RRULE:FREQ=WEEKLY;COUNT=3', 'END:VEVENT'],
+    ...                 {'holiday': 'GREEN'}))
+    ['2020/12/25 GREEN', '2021/01/04..2021/01/18 weekly mon RED']
+    """
+    return EventMarkLines(lines, categories)
@@ -0,0 +1,219 @@
+"""
+Date layout of calendar cells
+
+The layout is the color and language independent part of a calendar:
+the dates of every row, their week numbers, which days are filled, and where the month abbreviations go.
+It only depends on the first weekday, the displayed months, contiguous mode and the week numbering rule,
+so the layout of a year is computed once and shared by every render with the same parameters.
+
+The rows of a month only depend on the weekday of its 1st day, its length and the length of the previous month,
+so they are built from templates with pre-formatted day numbers.
+"""
+
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+from .weeknum import WeekNumbering
+
+# Right-aligned day numbers
+day_strs = ['{:>2}'.format(d) for d in range(32)]
+
+# 7 day numbers
+#   in_range: whether each day belongs to the displayed month(s), the others are filled
+#   text, filled_text: the formatted days without colors, with filled days blanked or shown
+Row = namedtuple('Row', ['days', 'in_range', 'text', 'filled_text'])
+
+
+class Week(namedtuple('Week', ['first', 'row', 'wk', 'abbr'])):
+    r"""
+    A Row placed at a date
+
+      first: ordinal of the first date
+      wk: week number
+      abbr: (month, part index) of the month abbreviation shown beside the row, or None
+    """
+    __slots__ = ()
+
+    @property
+    def dates(self):
+        return tuple(date.fromordinal(self.first + i) for i in range(7))
+
+
+# The rows of a cell, ``leading_date`` is the leading date of the first month in the cell
+Block = namedtuple('Block', ['leading_date', 'weeks'])
+
+
+def monthdatescalendar(year, month, firstweekday):
+    r"""
+    Same as ``calendar.Calendar(firstweekday).monthdatescalendar(year, month)``,
+    without importing `calendar` module
+
+    >>> monthdatescalendar(2020, 3, 6)[-1]
+    [datetime.date(2020, 3, 29), datetime.date(2020, 3, 30), datetime.date(2020, 3, 31), datetime.date(2020, 4, 1), datetime.date(2020, 4, 2), datetime.date(2020, 4, 3), datetime.date(2020, 4, 4)]
+    """
+    first = date(year, month, 1)
+    start = first.toordinal() - (first.weekday() - firstweekday) % 7
+    end = date(year + month // 12, month % 12 + 1, 1).toordinal()
+    return [[date.fromordinal(o + i) for i in range(7)] for o in range(start, end, 7)]
+
+
+@lru_cache(maxsize=1024)
+def make_row(days, in_range):
+    r"""
+    >>> make_row((29, 30, 31, 1, 2, 3, 4), (True, True, True, False, False, False, False)).text
+    '29 30 31            '
+    """
+    return Row(days, in_range,
+               ' '.join(day_strs[d] if r else '  ' for d, r in zip(days, in_range)),
+               ' '.join(day_strs[d] for d in days))
+
+
+def month_length(year, month):
+    r"""
+    >>> month_length(2020, 2), month_length(9999, 12)
+    (29, 31)
+    """
+    if month == 12:
+        return 31
+
+    return (date(year, month + 1, 1) - date(year, month, 1)).days
+
+
+@lru_cache(maxsize=None)
+def month_template(weekday, length, prev_length, firstweekday):
+    r"""
+    Return the Rows of a month whose 1st day is on ``weekday`` and has ``length`` days,
+    the filled days before the 1st come from the previous month of ``prev_length`` days
+
+    >>> [row.days[0] for row in month_template(6, 31, 29, 6)]
+    [1, 8, 15, 22, 29]
+    >>> month_template(2, 30, 31, 6)[0].filled_text
+    '29 30 31  1  2  3  4'
+    """
+    lead = (weekday - firstweekday) % 7
+    days = [prev_length - lead + 1 + i for i in range(lead)] + list(range(1, length + 1))
+    days += list(range(1, (-len(days)) % 7 + 1))
+    return tuple(
+            make_row(tuple(days[i:i + 7]), tuple(lead <= j < lead + length for j in range(i, i + 7)))
+            for i in range(0, len(days), 7))
+
+
+def iter_weeks(firstweekday, first, last, wk_rule='jan1', year=None, with_abbr=False):
+    r"""
+    Yield the Weeks of contiguous mode, from the week of ordinal ``first`` to the week of ordinal ``last``
+
+    Every week is generated once, the days out of [first, last] are filled days.
+    ``year`` is the current year, the week across two years is numbered in the current year
+    if it starts in the current year, otherwise in the following year.
+    The month abbreviations are placed beside the weeks if ``with_abbr`` is true.
+
+    >>> weeks = list(iter_weeks(6, date(2020, 3, 10).toordinal(), date(2020, 3, 20).toordinal()))
+    >>> [(w.row.days, w.row.in_range.count(True)) for w in weeks]
+    [((8, 9, 10, 11, 12, 13, 14), 5), ((15, 16, 17, 18, 19, 20, 21), 6)]
+    """
+    week_number = WeekNumbering(wk_rule, firstweekday)
+    start, end = date.fromordinal(first), date.fromordinal(last)
+    months = (start.year * 12 + start.month - 1, end.year * 12 + end.month - 1)
+
+    # If the span starts in the middle of a month, its abbreviation starts from the first row
+    first_week = first - (start.weekday() - firstweekday) % 7
+    first_tail = date.fromordinal(first_week + 6)
+
+    for week_first in range(first_week, last + 1, 7):
+        head, tail = date.fromordinal(week_first), date.fromordinal(week_first + 6)
+        if head.month == tail.month:
+            days = tuple(range(head.day, head.day + 7))
+        else:
+            days = tuple(range(head.day, head.day + 7 - tail.day)) + tuple(range(1, tail.day + 1))
+
+        if first <= week_first and week_first + 6 <= last:
+            in_range = (True,) * 7
+        else:
+            in_range = tuple(first <= week_first + i <= last for i in range(7))
+
+        if head.year == tail.year or (head.year == year and week_first >= first):
+            wk = week_number(head, year=head.year)
+        else:
+            # Edge case, sometimes wk53 needs to be changed to wk01
+            wk = week_number(head, year=tail.year)
+
+        # The abbreviation is split into parts, one part per row,
+        # counted from the first row that ends in the month
+        if with_abbr and months[0] <= tail.year * 12 + tail.month - 1 <= months[1]:
+            part = (tail.day - 1) // 7
+            if (tail.year, tail.month) == (first_tail.year, first_tail.month):
+                part -= (first_tail.day - 1) // 7
+
+            abbr = (tail.month, part)
+        else:
+            abbr = None
+
+        yield Week(week_first, make_row(days, in_range), wk, abbr)
+
+
+def strip(firstweekday, first, last, wk_rule='jan1', year=None):
+    r"""
+    Return the Block of contiguous mode of the dates from ``first`` to ``last`` (inclusive)
+
+    >>> block = strip(6, date(2020, 3, 10), date(2020, 6, 2))
+    >>> len(block.weeks), block.weeks[0].abbr, block.weeks[-1].row.in_range.count(True)
+    (13, (3, 0), 3)
+    """
+    with_abbr = (first.year, first.month) != (last.year, last.month)
+    weeks = iter_weeks(firstweekday, first.toordinal(), last.toordinal(), wk_rule, year, with_abbr)
+    return Block(first.replace(day=1), tuple(weeks))
+
+
+@lru_cache(maxsize=16)
+def year_layout(firstweekday, year, wk_rule='jan1'):
+    r"""
+    Return the Blocks of the 12 months of ``year``
+
+    >>> blocks = year_layout(6, 2020)
+    >>> len(blocks), blocks[2].leading_date, len(blocks[2].weeks)
+    (12, datetime.date(2020, 3, 1), 5)
+    """
+    week_number = WeekNumbering(wk_rule, firstweekday)
+
+    blocks = []
+    prev_length = 31
+    for month in range(1, 13):
+        ld = date(year, month, 1)
+        length = month_length(year, month)
+
+        # Build the rows from template
+        weekday = ld.weekday()
+        first = ld.toordinal() - (weekday - firstweekday) % 7
+        weeks = tuple(Week(first + 7 * i, row, week_number(date.fromordinal(first + 7 * i), year=year), None)
+                      for i, row in enumerate(month_template(weekday, length, prev_length, firstweekday)))
+        blocks.append(Block(ld, weeks))
+        prev_length = length
+
+    return tuple(blocks)
+
+
+def layout(firstweekday, month_leading_dates, cont=False, wk_rule='jan1', year=None):
+    r"""
+    Yield the Blocks of the given months (leading dates), one Block per month
+    (or a single Block in contiguous mode)
+
+    ``year`` is the current year, it's only used by contiguous mode,
+    to decide which year the rows across two years belong to.
+    The months are laid out one year at a time, and the recent years are shared by the renders.
+
+    >>> blocks = list(layout(6, (date(2020, 3, 1),)))
+    >>> len(blocks), len(blocks[0].weeks), blocks[0].weeks[0].wk
+    (1, 5, 10)
+    >>> blocks[0].weeks[-1].row.in_range
+    (True, True, True, False, False, False, False)
+    """
+    if cont:
+        month_leading_dates = tuple(month_leading_dates)
+        last = month_leading_dates[-1]
+        yield strip(firstweekday, month_leading_dates[0], last.replace(day=month_length(last.year, last.month)),
+                    wk_rule, year)
+        return
+
+    for ld in month_leading_dates:
+        yield year_layout(firstweekday, ld.year, wk_rule)[ld.month - 1]
@@ -0,0 +1,458 @@
+"""
+Date marking file loader
+
+Date marking file contains one mark per line, either a date ``yyyy/mm/dd color``,
+or a range and/or a recurrence rule::
+
+    2020/12/20..2021/01/03 red              every day of a range
+    weekly fri GREEN                        every Friday
+    monthly 15 blue                         the 15th of every month
+    monthly last fri cyan                   the last Friday of every month (1st .. 5th, last)
+    yearly 12/25 RED                        every December 25th
+    yearly 11 4th thu YELLOW                the 4th Thursday of every November
+    2021/01/01..2021/06/30 weekly mon red   every Monday of a range
+
+Dates override ranges and rules, a latter range or rule overrides the former ones.
+Ranges and rules are kept as they are, in an interval index,
+and only expanded into the dates within the displayed range.
+
+iCalendar (``.ics``) files are also accepted, their events are translated into marks, see `ics`.
+
+Large files are indexed: the valid lines are sorted by date into a compact binary index,
+stored in the cache directory and reused until the file is modified.
+The index is memory-mapped, and only the entries within the displayed range are materialized.
+"""
+
+from __future__ import print_function
+
+import mmap
+import os
+import struct
+import sys
+
+from datetime import date
+from os.path import expanduser, join, realpath
+
+from .config import Color
+from .layout import month_length
+
+date_mark_pattern = r'^(\d\d\d\d/\d\d/\d\d) +([\w:]+) *'
+
+weekday_names = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+nth_names = {'1st': 1, '2nd': 2, '3rd': 3, '4th': 4, '5th': 5, 'last': -1}
+
+
+def parse_date(text):
+    return date(*map(int, text.split('/')))
+
+
+def parse_weekday(text):
+    r"""
+    >>> parse_weekday('Friday'), parse_weekday('mon')
+    (4, 0)
+    """
+    text = text.lower()
+    for idx, name in enumerate(weekday_names):
+        if text in (name, name[:3]):
+            return idx
+
+    raise ValueError(text)
+
+
+def nth_weekday(year, month, nth, weekday):
+    r"""
+    Return the day of the ``nth`` ``weekday`` in the month (-1 for the last one), or None if there is no such day
+
+    >>> nth_weekday(2020, 11, 4, 3), nth_weekday(2020, 3, -1, 4), nth_weekday(2020, 2, 5, 0)
+    (26, 27, None)
+    """
+    length = month_length(year, month)
+    day = 1 + (weekday - date(year, month, 1).weekday()) % 7
+    if nth < 0:
+        return day + (length - day) // 7 * 7
+
+    day += (nth - 1) * 7
+    return day if day <= length else None
+
+
+class MarkRule:
+    r"""
+    A range of dates [first, last] (ordinals), optionally with a recurrence rule
+
+    >>> rule = MarkRule.parse('2020/03/01..2020/03/31 weekly sat red')
+    >>> [date.fromordinal(o).day for o in rule.occurrences(date(2020, 3, 10).toordinal(), date.max.toordinal())]
+    [14, 21, 28]
+    >>> [str(date.fromordinal(o)) for o in MarkRule.parse('yearly 02/29 red').occurrences(
+    ...     date(2020, 1, 1).toordinal(), date(2024, 12, 31).toordinal())]
+    ['2020-02-29', '2024-02-29']
+    >>> [str(date.fromordinal(o)) for o in MarkRule.parse('monthly last fri red').occurrences(
+    ...     date(9999, 12, 1).toordinal(), date.max.toordinal())]
+    ['9999-12-31']
+    """
+    __slots__ = ('first', 'last', 'freq', 'month', 'day', 'nth', 'weekday', 'color', 'line')
+
+    def __init__(self, first, last, freq, month, day, nth, weekday, color, line):
+        self.first = first
+        self.last = last
+        self.freq = freq
+        self.month = month
+        self.day = day
+        self.nth = nth
+        self.weekday = weekday
+        self.color = color
+        self.line = line
+
+    @classmethod
+    def parse(cls, line):
+        r"""
+        Parse ``[yyyy/mm/dd..yyyy/mm/dd] [rule] color``, raise ValueError if invalid
+        """
+        line = line.split('#', 1)[0].strip()
+        tokens = line.split()
+        if len(tokens) < 2:
+            raise ValueError(line)
+
+        first, last = date.min.toordinal(), date.max.toordinal()
+        if '..' in tokens[0]:
+            begin, _, end = tokens.pop(0).partition('..')
+            first, last = parse_date(begin).toordinal(), parse_date(end).toordinal()
+            if first > last:
+                raise ValueError(line)
+
+        elif tokens[0] not in ('weekly', 'monthly', 'yearly'):
+            raise ValueError(line)
+
+        color = tokens.pop()
+        Color(color)
+        freq = tokens.pop(0) if tokens else None
+        month = day = nth = weekday = None
+        if freq == 'weekly' and len(tokens) == 1:
+            weekday = parse_weekday(tokens[0])
+
+        elif freq == 'yearly' and len(tokens) == 1:
+            month, day = map(int, tokens[0].split('/'))
+            date(2000, month, day)
+
+        elif freq == 'monthly' and len(tokens) == 1:
+            day = int(tokens[0])
+            date(2000, 1, day)
+
+        elif freq in ('monthly', 'yearly') and len(tokens) == 2 + (freq == 'yearly'):
+            if freq == 'yearly':
+                month = int(tokens.pop(0))
+                date(2000, month, 1)
+
+            if tokens[0].lower() not in nth_names:
+                raise ValueError(line)
+
+            nth = nth_names[tokens[0].lower()]
+            weekday = parse_weekday(tokens[1])
+
+        elif freq is not None or tokens:
+            raise ValueError(line)
+
+        return cls(first, last, freq, month, day, nth, weekday, color, line)
+
+    def occurrences(self, first, last):
+        r"""
+        Iterate over the ordinals of the marked dates within ordinal range [first, last]
+        """
+        first, last = max(first, self.first), min(last, self.last)
+        if first > last:
+            return
+
+        if self.freq is None:
+            yield from range(first, last + 1)
+            return
+
+        if self.freq == 'weekly':
+            # Ordinal 1 is a Monday
+            yield from range(first + (self.weekday - (first - 1)) % 7, last + 1, 7)
+            return
+
+        begin, end = date.fromordinal(first), date.fromordinal(last)
+        if self.freq == 'yearly':
+            months = ((year, self.month) for year in range(begin.year, end.year + 1))
+        else:
+            months = ((idx // 12, idx % 12 + 1)
+                      for idx in range(begin.year * 12 + begin.month - 1, end.year * 12 + end.month))
+
+        for year, month in months:
+            if self.nth is None:
+                day = self.day if self.day <= month_length(year, month) else None
+            else:
+                day = nth_weekday(year, month, self.nth, self.weekday)
+
+            if day is not None:
+                ordinal = date(year, month, day).toordinal()
+                if first <= ordinal <= last:
+                    yield ordinal
+
+
+class MarksIndex:
+    r"""
+    Sorted (date ordinal, color setting) records in a buffer, followed by the lines of the ranges and rules
+
+    >>> index = MarksIndex.build(['2020/03/18 BLUE', '2020/03/01 red', '2020/13/01 red', 'oops'])
+    >>> len(index), index.invalid
+    (2, 2)
+    >>> list(index.lookup(date(2020, 3, 10).toordinal(), date(2020, 3, 31).toordinal()))
+    [(737502, 'BLUE')]
+    """
+    magic = b'TCMARKS2'
+    header = struct.Struct('<8sqqIII')
+    record = struct.Struct('<i24s')
+
+    def __init__(self, buf, count, invalid, rules=()):
+        self.buf = buf
+        self.count = count
+        self.invalid = invalid
+        self.rules = list(rules)
+
+        # Interval index: the rules sorted by the first date of their ranges
+        self.starts = sorted((rule.first, idx) for idx, rule in enumerate(self.rules))
+        self.start_ordinals = [first for first, idx in self.starts]
+
+    def __len__(self):
+        return self.count
+
+    def ordinal(self, idx):
+        return self.record.unpack_from(self.buf, self.header.size + idx * self.record.size)[0]
+
+    def bisect(self, ordinal):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ordinal(mid) < ordinal:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def lookup(self, first, last):
+        r"""
+        Iterate over (ordinal, color setting) records within ordinal range [first, last]
+        """
+        for idx in range(self.bisect(first), self.count):
+            ordinal, color = self.record.unpack_from(self.buf, self.header.size + idx * self.record.size)
+            if ordinal > last:
+                break
+
+            yield ordinal, color.rstrip(b'\0').decode('ascii')
+
+    def span(self):
+        r"""
+        Return the ordinal range [first, last] of the dates and the bounds of the ranges, or None if there are none
+
+        >>> index = MarksIndex.build(['2020/03/18 BLUE', '2020/01/01..2020/01/31 weekly fri red', 'monthly 15 red'])
+        >>> [str(date.fromordinal(o)) for o in index.span()]
+        ['2020-01-01', '2020-03-18']
+        """
+        ordinals = [rule.first for rule in self.rules if rule.first != date.min.toordinal()]
+        ordinals += [rule.last for rule in self.rules if rule.last != date.max.toordinal()]
+        if self.count:
+            ordinals += [self.ordinal(0), self.ordinal(self.count - 1)]
+
+        return (min(ordinals), max(ordinals)) if ordinals else None
+
+    def lookup_rules(self, first, last):
+        r"""
+        Return the rules whose ranges overlap ordinal range [first, last], in the order of the file
+
+        >>> index = MarksIndex.build(['2020/03/01..2020/03/10 red', '2020/04/01..2020/04/30 blue', 'weekly fri red'])
+        >>> [rule.line for rule in index.lookup_rules(date(2020, 3, 11).toordinal(), date(2020, 4, 1).toordinal())]
+        ['2020/04/01..2020/04/30 blue', 'weekly fri red']
+        """
+        import bisect
+        candidates = self.starts[:bisect.bisect_right(self.start_ordinals, last)]
+        return [self.rules[idx] for idx in sorted(idx for _, idx in candidates if self.rules[idx].last >= first)]
+
+    @classmethod
+    def parse(cls, lines):
+        r"""
+        Return the valid (ordinal, color setting) records, the ranges and rules, and the number of invalid lines
+
+        The lines skipped by the source itself are counted in its ``invalid`` attribute, if any, see `ics`.
+        """
+        import re
+        date_mark_regex = re.compile(date_mark_pattern)
+
+        records = []
+        rules = []
+        invalid = 0
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            m = date_mark_regex.match(line)
+            try:
+                if not m:
+                    rules.append(MarkRule.parse(line))
+                    continue
+
+                mark_date = date(*map(int, m.group(1).split('/')))
+                color = m.group(2)
+                Color(color)
+                color.encode('ascii')
+                if len(color) > cls.record.size - 4:
+                    raise ValueError(color)
+
+            except ValueError:
+                invalid += 1
+                continue
+
+            records.append((mark_date.toordinal(), color))
+
+        invalid += getattr(lines, 'invalid', 0)
+
+        # Stable sort, the latter lines override the former ones
+        records.sort(key=lambda r: r[0])
+        return records, rules, invalid
+
+    @classmethod
+    def pack(cls, records, rules, invalid, stamp=(0, 0)):
+        rule_lines = '\n'.join(rule.line for rule in rules).encode('utf-8')
+        size = cls.header.size + len(records) * cls.record.size
+        buf = bytearray(size + len(rule_lines))
+        cls.header.pack_into(buf, 0, cls.magic, stamp[0], stamp[1], len(records), invalid, len(rule_lines))
+        for idx, (ordinal, color) in enumerate(records):
+            cls.record.pack_into(buf, cls.header.size + idx * cls.record.size, ordinal, color.encode('ascii'))
+
+        buf[size:] = rule_lines
+        return buf
+
+    @classmethod
+    def build(cls, lines):
+        records, rules, invalid = cls.parse(lines)
+        return cls(cls.pack(records, rules, invalid), len(records), invalid, rules)
+
+    @classmethod
+    def open(cls, index_path, stamp):
+        r"""
+        Memory-map the index file, return None if it's missing or out of date
+        """
+        try:
+            with open(index_path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(buf) < cls.header.size:
+            return None
+
+        magic, mtime, size, count, invalid, rules_size = cls.header.unpack_from(buf, 0)
+        records_end = cls.header.size + count * cls.record.size
+        if (magic, mtime, size) != (cls.magic, stamp[0], stamp[1]) or len(buf) != records_end + rules_size:
+            return None
+
+        # The ranges and rules are few, parse them again
+        rule_lines = buf[records_end:].decode('utf-8')
+        rules = [MarkRule.parse(line) for line in rule_lines.split('\n')] if rule_lines else []
+        return cls(buf, count, invalid, rules)
+
+    @classmethod
+    def save(cls, index_path, lines, stamp):
+        records, rules, invalid = cls.parse(lines)
+        buf = cls.pack(records, rules, invalid, stamp)
+        try:
+            import tempfile
+
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix='.tmp')
+            try:
+                with open(fd, 'wb') as f:
+                    f.write(buf)
+
+                os.replace(tmp, index_path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+        except OSError:
+            pass
+
+        return cls(buf, len(records), invalid, rules)
+
+
+def index_path(path):
+    import hashlib
+    from .cache import cache_dir
+
+    return join(cache_dir(), 'marks', hashlib.sha1(path.encode('utf-8')).hexdigest() + '.idx')
+
+
+def is_ics(name):
+    return isinstance(name, str) and name.lower().endswith('.ics')
+
+
+def load_index(marks_file, categories=None):
+    r"""
+    Return the index of an opened date marking file,
+    the index file is reused if the date marking file is not modified
+
+    iCalendar files are translated with the ``categories`` mapping, see `ics`.
+    """
+    lines = marks_file
+    key = ''
+    if is_ics(getattr(marks_file, 'name', None)):
+        from .ics import mark_lines, parse_categories
+        lines = mark_lines(marks_file, parse_categories(categories))
+        # The colors depend on the mapping
+        key = '\0' + (categories or '')
+
+    try:
+        st = os.fstat(marks_file.fileno())
+        path = realpath(marks_file.name) + key
+    except (AttributeError, OSError, ValueError):
+        # Not a real file
+        return MarksIndex.build(lines)
+
+    stamp = (st.st_mtime_ns, st.st_size)
+    return MarksIndex.open(index_path(path), stamp) or MarksIndex.save(index_path(path), lines, stamp)
+
+
+def load_marks(path, start=None, end=None, categories=None):
+    r"""
+    Read date marking file (path or file object) into a ``{date: Color}`` dict
+
+    Only the dates in the months from ``start`` to ``end`` are loaded if specified,
+    ranges and rules are expanded only within them.
+    A missing end is bounded by the dates and ranges of the file, e.g. a file of rules only is empty without a range.
+    ``categories`` is the ``marks.categories`` setting of iCalendar files.
+    """
+    try:
+        if callable(getattr(path, 'read', None)):
+            marks_file = path
+        elif is_ics(path):
+            marks_file = open(expanduser(path), encoding='utf-8', errors='replace')
+        else:
+            marks_file = open(expanduser(path))
+
+    except FileNotFoundError:
+        print('Warning: Mark file "{}" does not exist'.format(path), file=sys.stderr)
+        return {}
+
+    with marks_file:
+        index = load_index(marks_file, categories)
+
+    if index.invalid:
+        print('Warning: {} invalid line(s) in mark file "{}"'.format(
+            index.invalid, getattr(path, 'name', path)), file=sys.stderr)
+
+    # Without a range, the rules are only expanded within the span of the dates and ranges
+    span = index.span() or (0, -1)
+    first = span[0] if start is None else date(start.year, start.month, 1).toordinal()
+    last = span[1] if end is None else date(end.year, end.month, month_length(end.year, end.month)).toordinal()
+
+    ret = {}
+    for rule in index.lookup_rules(first, last):
+        color = Color(rule.color)
+        for ordinal in rule.occurrences(first, last):
+            ret[date.fromordinal(ordinal)] = color
+
+    for ordinal, color in index.lookup(first, last):
+        ret[date.fromordinal(ordinal)] = Color(color)
+
+    return ret
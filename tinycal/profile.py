@@ -0,0 +1,138 @@
+"""
+Per-phase timing and counters of a `tcal` run
+
+Enabled by ``--profile [FILE]`` or ``TINYCAL_PROFILE`` environment variable
+(``1`` or ``-`` for stderr, otherwise a file path).
+One JSON object is written per run, appended to the file if specified,
+so the records of many shell sessions can be aggregated.
+
+This module is imported only if profiling is enabled,
+the counting hooks are installed while the profile is active, and removed afterwards.
+"""
+
+import json
+import os
+import sys
+import time
+
+from . import tcal
+from .config import Color
+from .marks import MarksIndex
+
+
+def target_from_env():
+    r"""
+    Return the profile target of ``TINYCAL_PROFILE``, or None if profiling is disabled
+    """
+    setting = os.environ.get('TINYCAL_PROFILE', '')
+    if setting.lower() in ('', '0', 'false', 'no'):
+        return None
+
+    return '-' if setting.lower() in ('1', 'true', 'yes', '-') else setting
+
+
+class Profile:
+    r"""
+    Accumulated phase durations (seconds) and counters
+
+    >>> p = Profile()
+    >>> with p:
+    ...     s = Color('red')('x')
+    >>> p.counters['colors']
+    1
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.hooks = []
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def iterate(self, phase, iterable, counter=None):
+        r"""
+        Iterate over ``iterable``, account the time spent in it to ``phase``
+        """
+        it = iter(iterable)
+        while True:
+            t = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.add(phase, time.perf_counter() - t)
+
+            if counter:
+                self.count(counter)
+
+            yield item
+
+    def phase(self, phase, func, *args, **kwargs):
+        r"""
+        Call ``func`` and account its duration to ``phase``
+        """
+        t = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.add(phase, time.perf_counter() - t)
+
+    def hook(self, obj, name, wrapper):
+        self.hooks.append((obj, name, obj.__dict__[name]))
+        setattr(obj, name, wrapper(getattr(obj, name)))
+
+    def __enter__(self):
+        profile = self
+
+        def count_colors(call):
+            def wrapper(color, item):
+                profile.count('colors')
+                return call(color, item)
+            return wrapper
+
+        def count_marks_lines(parse):
+            def wrapper(lines):
+                records, rules, invalid = parse(lines)
+                profile.count('marks_lines', len(records) + len(rules) + invalid)
+                return records, rules, invalid
+            return classmethod(lambda cls, lines: wrapper(lines))
+
+        def time_cells(iter_cells):
+            def wrapper(*args, **kwargs):
+                return profile.iterate('cells', iter_cells(*args, **kwargs), counter='cells')
+            return wrapper
+
+        self.hook(Color, '__call__', count_colors)
+        self.hook(MarksIndex, 'parse', count_marks_lines)
+        self.hook(tcal, 'iter_cells', time_cells)
+        return self
+
+    def __exit__(self, *exc):
+        while self.hooks:
+            obj, name, value = self.hooks.pop()
+            setattr(obj, name, value)
+
+    def report(self, **extra):
+        ret = dict(extra)
+        ret['total_ms'] = round((time.perf_counter() - self.started) * 1000, 3)
+        phases = dict(self.phases)
+        if 'render' in phases:
+            # Cells are built lazily while rendering, keep them apart
+            phases['render'] -= phases.get('cells', 0)
+
+        ret['phases_ms'] = {k: round(v * 1000, 3) for k, v in phases.items()}
+        ret['counters'] = dict(self.counters)
+        return ret
+
+    def emit(self, target, **extra):
+        line = json.dumps(self.report(**extra), sort_keys=True)
+        if target == '-':
+            print(line, file=sys.stderr)
+        else:
+            with open(os.path.expanduser(target), 'a') as f:
+                f.write(line + '\n')
@@ -1,6 +1,7 @@
-from unicodedata import east_asian_width
+from itertools import islice, zip_longest
 
 from .config import Color
+from .layout import day_strs
 
 border_template = {
         'template': [
@@ -70,21 +71,152 @@ border_template = {
             ],
         }
 
+# Display widths of non-ASCII strings
+str_widths = {}
+
 def str_width(s):
-    return sum(1 + (east_asian_width(c) in 'WF') for c in s)
+    r"""
+    >>> str_width('March 2020'), str_width('３月 2020')
+    (10, 9)
+    """
+    if s.isascii():
+        return len(s)
+
+    try:
+        return str_widths[s]
+    except KeyError:
+        pass
+
+    # Imported on first use, most strings are ASCII
+    from unicodedata import east_asian_width
+    width = sum(1 + (east_asian_width(c) in 'WF') for c in s)
+    if len(str_widths) < 4096:
+        str_widths[s] = width
+
+    return width
+
+
+# Palette indices of no color, and of a blank (not filled) day
+PLAIN, BLANK = 0, 1
+
+
+class Palette:
+    r"""
+    Colors of the cells, referred by index
+
+    >>> palette = Palette()
+    >>> palette.add(Color('RED')), palette.add(Color('')), palette.add(Color('RED'))
+    (2, 0, 2)
+    >>> palette.piece(2, 7)
+    '\x1b[1;31m 7\x1b[0m'
+    """
+    def __init__(self):
+        self.colors = [Color(''), None]
+        self.indices = {}
+        self.pieces = {}
+
+        # Colored rows, keyed by (Row, palette indices of the days)
+        self.rows = {}
+
+    def add(self, color):
+        if not color:
+            return PLAIN
+
+        try:
+            return self.indices[color]
+        except KeyError:
+            self.colors.append(color)
+            idx = self.indices[color] = len(self.colors) - 1
+            return idx
+
+    def replace(self, color, new_color):
+        r"""
+        Recolor everything in ``color`` with ``new_color``, the cells are not built again
+        """
+        self.colors[self.indices[color]] = new_color
+        self.pieces.clear()
+        self.rows.clear()
+
+    def piece(self, idx, number):
+        r"""
+        Return the colored, right-aligned number (a day or a week number)
+        """
+        try:
+            return self.pieces[(idx, number)]
+        except KeyError:
+            piece = self.pieces[(idx, number)] = self.colors[idx](
+                    day_strs[number] if 0 <= number < len(day_strs) else '{:>2}'.format(number))
+            return piece
+
+    def days(self, row, colors):
+        r"""
+        Return the colored days of ``row``, ``colors`` are the palette indices of the days
+        """
+        key = (row, colors)
+        try:
+            return self.rows[key]
+        except KeyError:
+            pass
+
+        if max(colors) <= BLANK:
+            days = row.text if BLANK in colors else row.filled_text
+        else:
+            piece = self.piece
+            days = ' '.join('  ' if c == BLANK else piece(c, day) for c, day in zip(colors, row.days))
+
+        # Bounded, the rows with marks rarely repeat
+        if len(self.rows) < 4096:
+            self.rows[key] = days
+
+        return days
 
 
 class Cell:
-    def __init__(self, config):
+    r"""
+    The weeks of a month (or the months of contiguous mode)
+
+    The weeks are stored compactly: the ``Week`` sequence of the layout (shared, not copied),
+    8 palette indices per week (week number and days) in a bytes string,
+    and the month abbreviations only if there are any.
+    The strings are only produced when the lines are iterated.
+    """
+    __slots__ = ('config', 'palette', 'title', 'weekday_title', 'wk_title',
+                 'weeks', 'colors', 'months', 'assigned_height', '_month_col_width')
+
+    def __init__(self, config, palette=None):
         self.config = config
+        self.palette = palette or Palette()
         self.title = None
         self.weekday_title = ''
         self.wk_title = 'WK'
-        self.lines = []
+        self.weeks = ()
+        self.colors = b''
+        self.months = None
         self.assigned_height = 0
+        self._month_col_width = None
+
+    def set_weeks(self, weeks, colors, months=None):
+        r"""
+        Set the weeks, ``colors`` are the palette indices of the week number and the 7 days of every week,
+        ``months`` are the month abbreviations beside the weeks
+        """
+        self.weeks = weeks
+        self.colors = bytes(colors)
+        self.months = months if months and any(months) else None
+        self._month_col_width = None
+
+    def line(self, idx):
+        r"""
+        Return the (week number, days, month abbreviation) strings of the ``idx``-th week
+        """
+        week = self.weeks[idx]
+        colors = self.colors[idx * 8:idx * 8 + 8]
+        return (self.palette.piece(colors[0], week.wk), self.palette.days(week.row, colors[1:]),
+                self.months[idx] if self.months else '')
 
-    def append(self, wk='', days=' ' * (7 * 2 + 6), month=''):
-        self.lines.append((wk, days, month))
+    @property
+    def lines(self):
+        return [self.line(idx) for idx in range(len(self.weeks))]
 
     @property
     def width(self):
@@ -110,12 +242,16 @@ class Cell:
 
     @property
     def month_col_width(self):
-        return max([str_width(line[2]) for line in self.lines])
+        # Calculated once, invalidated by `set_weeks()`
+        if self._month_col_width is None:
+            self._month_col_width = max(map(str_width, self.months or ()), default=0)
+
+        return self._month_col_width
 
     @property
     def height(self):
         # Only count dynamic part, i.e. no need to count title line
-        return len(self.lines)
+        return len(self.weeks)
 
     @height.setter
     def height(self, val):
@@ -136,13 +272,13 @@ class Cell:
         bs = border_template[self.config.border_style]
         bc = self.config.color_border
 
+        mcw = self.month_col_width
+        internal_width = self.internal_width
+
         # Title
-        pad_total = self.internal_width - str_width(self.title)
+        pad_total = internal_width - str_width(self.title)
         pad = (pad_total // 2) * ' '
-        self.title = pad + self.title + pad + (pad_total % 2) * ' '
-        yield self.padding(self.config.color_title(self.title))
-
-        mcw = self.month_col_width
+        yield self.padding(self.config.color_title(pad + self.title + pad + (pad_total % 2) * ' '))
 
         # Cell internal border - title (if enabled)
         if self.config.border == 'full':
@@ -174,27 +310,43 @@ class Cell:
         yield self.padding(_render_wk(self.wk_title, True) + self.weekday_title + _render_month(''))
 
         # Days
-        for wk, line, month in self.lines:
+        for idx in range(len(self.weeks)):
+            wk, line, month = self.line(idx)
             yield self.padding(_render_wk(wk, False) + line + _render_month(month))
 
-        for i in range(len(self.lines), self.assigned_height):
+        for i in range(len(self.weeks), self.assigned_height):
             yield self.padding(_render_wk('  ', False) + ' ' * (7 * 2 + 6))
 
 
 class TinyCalRenderer:
-    def __init__(self, config):
+    def __init__(self, config, cells=None):
         self.config = config
-        self.cells = []
+        self.cells = [] if cells is None else cells
 
     def append(self, cell):
         self.cells.append(cell)
 
     def render(self):
-        try:
-            from itertools import zip_longest
-        except:
-            from itertools import izip_longest as zip_longest
-
+        return '\n'.join(self.render_lines())
+
+    def render_lines(self):
+        r"""
+        Yield the output lines row by row
+
+        ``self.cells`` could be any iterable, only one row of cells is consumed at a time.
+        """
+        for lines in self.render_rows():
+            for line in lines:
+                yield line
+
+    def render_rows(self, pager=None):
+        r"""
+        Yield the output lines of every row of cells as a list,
+        including the borders above the row (and the bottom line for the last row)
+
+        If ``pager`` is given, a page break is inserted before the row that overflows the page,
+        the page is closed with bottom line and the next page starts with top line.
+        """
         # Select border style
         if self.config.border_style not in border_template:
             self.config.border_style = 'ascii'
@@ -202,75 +354,121 @@ class TinyCalRenderer:
         bs = border_template[self.config.border_style]
         bc = self.config.color_border
 
-        # If month range < config.col, don't use empty cells to fill up
-        effective_col = min(self.config.col, len(self.cells))
-
-        def list_to_grid(seq, col):
-            if len(seq) > col:
-                return [seq[:col]] + list_to_grid(seq[col:], col)
-            else:
-                return [seq + [Cell(self.config)] * (col - len(seq))]
-
-        grid = list_to_grid(self.cells, effective_col)
+        cells = iter(self.cells)
+        row = list(islice(cells, self.config.col))
+        if not row:
+            return
 
-        cell_width = self.cells[0].width
+        # If month range < config.col, don't use empty cells to fill up
+        effective_col = len(row)
 
-        ret = ''
+        cell_width = row[0].width
 
-        # Top line
+        top_line = bottom_line = None
         if self.config.border != 'off':
             if self.config.border_weld:
-                joiner = bs[0][-2]
+                top_joiner, bottom_joiner = bs[0][-2], bs[-1][-2]
             else:
-                joiner = bs[0][-1] + bs[0][0]
+                top_joiner, bottom_joiner = bs[0][-1] + bs[0][0], bs[-1][-1] + bs[-1][0]
 
-            ret += bc(bs[0][0] + joiner.join([cell_width * bs[0][1]] * effective_col) + bs[0][-1]) + '\n'
+            top_line = bc(bs[0][0] + top_joiner.join([cell_width * bs[0][1]] * effective_col) + bs[0][-1])
+            bottom_line = bc(bs[-1][0] + bottom_joiner.join([cell_width * bs[-1][1]] * effective_col) + bs[-1][-1])
+
+        row_idx = 0
+        while row:
+            row += [Cell(self.config)] * (effective_col - len(row))
 
-        for row_idx, row in enumerate(grid):
             row_height = max(cell.height for cell in row)
             for cell in row:
                 cell.height = row_height
 
-            if row_idx > 0:
+            if row_idx == 0:
+                # Top line
+                sep = [] if top_line is None else [top_line]
+
+            else:
                 # Inter-cell border
                 if self.config.border == 'off':
-                    ret += '\n'
+                    sep = ['']
                 else:
                     if self.config.border_weld:
-                        ret += bc(bs[-2][0] +
+                        sep = [bc(bs[-2][0] +
                                 bs[-2][-2].join(((cell_width * bs[-2][1]) for cell in row)) +
-                                bs[-2][-1]) + '\n'
+                                bs[-2][-1])]
                     else:
-                        ret += bc(bs[-1][0] +
+                        sep = [bc(bs[-1][0] +
                                 (bs[-1][-1] + bs[-1][0]).join(((cell_width * bs[-2][1]) for cell in row)) +
-                                bs[-1][-1]) + '\n'
-                        ret += bc(bs[0][0] +
+                                bs[-1][-1]),
+                               bc(bs[0][0] +
                                 (bs[0][-1] + bs[0][0]).join(((cell_width * bs[-2][1]) for cell in row)) +
-                                bs[0][-1]) + '\n'
+                                bs[0][-1])]
 
             # Days
+            body = []
             for line_nr, lines in enumerate(zip_longest(*row, fillvalue=' ' * cell_width)):
                 border_idx = min([3, line_nr]) + 1
                 if self.config.border != 'off':
                     if self.config.border_weld:
-                        ret += (bc(bs[border_idx][0]) +
+                        body.append(bc(bs[border_idx][0]) +
                                 bc(bs[border_idx][-2]).join(lines) +
-                                bc(bs[border_idx][-1]) + '\n')
+                                bc(bs[border_idx][-1]))
                     else:
-                        ret += (bc(bs[border_idx][0]) +
+                        body.append(bc(bs[border_idx][0]) +
                                 bc(bs[border_idx][-1] + bs[border_idx][0]).join(lines) +
-                                bc(bs[border_idx][-1]) + '\n')
+                                bc(bs[border_idx][-1]))
 
                 else:
-                    ret += ' '.join(lines) +'\n'
+                    body.append(' '.join(lines))
 
-        # Bottom line
-        if self.config.border != 'off':
-            if self.config.border_weld:
-                joiner = bs[-1][-2]
-            else:
-                joiner = bs[-1][-1] + bs[-1][0]
+            row = list(islice(cells, effective_col))
+            row_idx += 1
+
+            # Bottom line
+            tail = [bottom_line] if (not row and bottom_line is not None) else []
+
+            if pager is None:
+                yield sep + body + tail
+                continue
 
-            ret += bc(bs[-1][0] + joiner.join([cell_width * bs[-1][1]] * effective_col) + bs[-1][-1]) + '\n'
+            # Leave room for the bottom line that closes the page if the next row breaks it
+            closing = len(tail) if tail or bottom_line is None else 1
+            if pager.fits(len(sep) + len(body) + closing):
+                ret = sep + body + tail
 
-        return ret.rstrip('\n')
+            elif row_idx == 1:
+                ret = sep + body + tail
+                ret[0] = '\f' + ret[0]
+                pager.new_page()
+
+            else:
+                # Close the page, and start a new page
+                ret = ([] if bottom_line is None else [bottom_line])
+                opening = ([] if top_line is None else [top_line]) + body + tail
+                opening[0] = '\f' + opening[0]
+                pager.add(len(ret))
+                pager.new_page()
+                ret += opening
+                pager.add(len(opening))
+                yield ret
+                continue
+
+            pager.add(len(ret))
+            yield ret
+
+
+class Pager:
+    r"""
+    Count the lines on the current page
+    """
+    def __init__(self, page_rows):
+        self.page_rows = page_rows
+        self.used = 0
+
+    def fits(self, lines):
+        return not self.page_rows or not self.used or self.used + lines <= self.page_rows
+
+    def add(self, lines):
+        self.used += lines
+
+    def new_page(self):
+        self.used = 0
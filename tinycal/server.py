@@ -0,0 +1,191 @@
+"""
+Resident server of `tcal --serve`
+
+Keeps the parsed configuration, date marks and rendered calendars in memory,
+and answers the requests of `tcal-client` over a Unix socket.
+Configuration and date marking files are reloaded only when their mtimes change,
+the ``TINYCAL_<FIELD>`` variables of the client override the configuration of every request.
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+
+from collections import OrderedDict
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import date
+from os.path import expanduser, join
+
+from . import tcal
+from .client import socket_path
+from .config import TinyCalConfig
+
+
+def file_stamp(path):
+    try:
+        return os.stat(expanduser(path)).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def resolve_paths(argv, cwd):
+    r"""
+    Resolve the relative paths of ``--marks`` (or its abbreviations) against the working directory of the client
+
+    >>> resolve_paths(['--marks', 'a', '--mark=/b', '--ma=c', '--', '--marks'], '/home/u')
+    ['--marks', '/home/u/a', '--mark=/b', '--ma=/home/u/c', '--', '--marks']
+    """
+    ret = []
+    args = iter(argv)
+    for arg in args:
+        ret.append(arg)
+        if arg == '--':
+            ret.extend(args)
+            break
+
+        name, eq, value = arg.partition('=')
+        if len(name) < 3 or not '--marks'.startswith(name):
+            continue
+
+        if not eq:
+            value = next(args, None)
+            if value is None:
+                break
+            ret.append(value)
+
+        if value != '-':
+            ret[-1] = (name + eq if eq else '') + join(cwd, value)
+
+    return ret
+
+
+class TinyCalServer:
+    output_cache_size = 128
+    marks_cache_size = 16
+
+    def __init__(self, path, calrcs=None):
+        self.path = path
+        self.calrcs = calrcs
+        self.conf = None
+        self.conf_stamp = None
+        self.marks = OrderedDict()
+        self.outputs = OrderedDict()
+        self.sock = None
+
+    def load_conf(self, environ=None):
+        r"""
+        Return a copy of the configuration, overridden by the ``TINYCAL_<FIELD>`` variables of the client
+        """
+        environ = environ or {}
+        calrcs = tcal.config_sources() if self.calrcs is None else self.calrcs
+        stamp = (tuple((rc, file_stamp(rc)) for rc in calrcs if isinstance(rc, str)),
+                 tuple(sorted(TinyCalConfig.env_overrides(environ).items())))
+        if self.conf is None or stamp != self.conf_stamp:
+            self.conf = TinyCalConfig.parse_conf(calrcs, environ)
+            self.conf_stamp = stamp
+
+        return self.conf.replace()
+
+    def load_marks(self, path, start, end, categories=None):
+        if not isinstance(path, str):
+            return tcal.load_marks(path, start, end, categories)
+
+        key = (path, start, end, categories)
+        stamp = file_stamp(path)
+        if stamp is None or self.marks.get(key, (None,))[0] != stamp:
+            self.marks[key] = (stamp, tcal.load_marks(path, start, end, categories))
+            if len(self.marks) > self.marks_cache_size:
+                self.marks.popitem(last=False)
+
+        self.marks.move_to_end(key)
+        return self.marks[key][1]
+
+    def handle(self, req):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 0
+
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                # The process is shared by the clients, the paths are resolved without changing directory
+                cwd = req.get('cwd') or os.getcwd()
+                args = tcal.parse_args(resolve_paths(req['argv'], cwd))
+                if args.serve is not None:
+                    raise ValueError('Already running as server')
+
+                conf = self.load_conf(req.get('env'))
+                if isinstance(conf.marks, str):
+                    conf = conf.replace(marks=join(cwd, expanduser(conf.marks)))
+                marks_path = getattr(args.marks, 'name', None) or conf.marks
+                key = (tuple(req['argv']), bool(req.get('isatty')), req.get('cwd'), date.today(),
+                       self.conf_stamp, marks_path, file_stamp(marks_path))
+
+                if key in self.outputs:
+                    self.outputs.move_to_end(key)
+                    if args.marks:
+                        args.marks.close()
+                else:
+                    self.outputs[key] = '\n'.join(tcal.run(conf, args, req.get('isatty'), self.load_marks))
+                    if len(self.outputs) > self.output_cache_size:
+                        self.outputs.popitem(last=False)
+
+                print(self.outputs[key])
+
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else (e.code is not None)
+
+            except Exception as e:
+                print('tcal: error: {}'.format(e), file=sys.stderr)
+                status = 1
+
+        return {'status': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+    def bind(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(16)
+
+    def serve_once(self):
+        conn, _ = self.sock.accept()
+        with conn:
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+
+            try:
+                reply = self.handle(json.loads(b''.join(chunks).decode('utf-8')))
+            except ValueError as e:
+                reply = {'status': 1, 'stdout': '', 'stderr': 'tcal: error: bad request: {}\n'.format(e)}
+
+            conn.sendall(json.dumps(reply).encode('utf-8'))
+
+    def serve_forever(self):
+        while True:
+            self.serve_once()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def serve(path=None):
+    server = TinyCalServer(path or socket_path())
+    server.bind()
+    print('tinycal: serving on {}'.format(server.path), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
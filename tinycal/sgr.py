@@ -0,0 +1,125 @@
+"""
+SGR run coalescing
+
+Every colored piece of the output is wrapped in its own ``ESC[...m`` ... ``ESC[0m`` pair,
+adjacent pieces with the same attributes repeat the same reset/set pairs.
+``coalesce()`` tracks the attributes (bold, foreground, background) along a line,
+and only emits the changes, so the output looks the same with fewer bytes.
+
+Spaces are only affected by the background, so they don't break a run of the same background.
+Every line still starts and ends with the default attributes.
+"""
+
+from functools import lru_cache
+
+ESC = '\033['
+
+DEFAULT = (False, None, None)
+
+
+@lru_cache(maxsize=1024)
+def apply(state, params):
+    r"""
+    Return the attributes after SGR ``params``, or None if any parameter is not understood
+
+    >>> apply(DEFAULT, '1;31')
+    (True, '1', None)
+    >>> apply((True, '1', None), '0;30;47')
+    (False, '0', '7')
+    >>> apply(DEFAULT, '4;31') is None
+    True
+    """
+    bold, fg, bg = state
+    for p in params.split(';'):
+        if p in ('', '0'):
+            bold, fg, bg = DEFAULT
+        elif p == '1':
+            bold = True
+        elif p == '22':
+            bold = False
+        elif len(p) == 2 and p[0] == '3' and p[1] in '01234567':
+            fg = p[1]
+        elif p == '39':
+            fg = None
+        elif len(p) == 2 and p[0] == '4' and p[1] in '01234567':
+            bg = p[1]
+        elif p == '49':
+            bg = None
+        else:
+            return None
+
+    return (bold, fg, bg)
+
+
+@lru_cache(maxsize=1024)
+def transition(current, target):
+    r"""
+    Return the shortest SGR sequence that changes attributes ``current`` into ``target``
+
+    >>> transition((False, '1', None), (False, '1', '7'))
+    '\x1b[47m'
+    >>> transition((True, '1', None), (False, '2', None))
+    '\x1b[0;32m'
+    >>> transition((True, '1', None), DEFAULT)
+    '\x1b[0m'
+    """
+    if current == target:
+        return ''
+
+    if target == DEFAULT:
+        return ESC + '0m'
+
+    bold, fg, bg = target
+    if (current[0] and not bold) or (current[1] and not fg) or (current[2] and not bg):
+        # Some attribute has to be turned off, start over
+        params = ['0'] + (['1'] if bold else []) + (['3' + fg] if fg else []) + (['4' + bg] if bg else [])
+    else:
+        params = ((['1'] if bold and not current[0] else []) +
+                  (['3' + fg] if fg != current[1] else []) +
+                  (['4' + bg] if bg != current[2] else []))
+
+    return ESC + ';'.join(params) + 'm'
+
+
+# Rows of months with the same layout and colors repeat a lot
+@lru_cache(maxsize=4096)
+def coalesce(line):
+    r"""
+    Remove the redundant SGR sequences of a line
+
+    >>> coalesce('\x1b[1;31m 1\x1b[0m \x1b[1;31m 2\x1b[0m')
+    '\x1b[1;31m 1  2\x1b[0m'
+    >>> coalesce('\x1b[47m \x1b[0m\x1b[47m \x1b[0m|')
+    '\x1b[47m  \x1b[0m|'
+    >>> coalesce('plain')
+    'plain'
+    """
+    if ESC not in line:
+        return line
+
+    chunks = line.split(ESC)
+    out = [chunks[0]]
+    current = DEFAULT  # attributes of the emitted output
+    wanted = DEFAULT   # attributes requested by the line
+    for chunk in chunks[1:]:
+        end = chunk.find('m')
+        wanted = apply(wanted, chunk[:end]) if end >= 0 else None
+        if wanted is None:
+            # Not a sequence we understand, leave the line as is
+            return line
+
+        text = chunk[end + 1:]
+        if not text:
+            continue
+
+        if text.strip(' ') == '' and current[2] == wanted[2]:
+            # Spaces only show the background
+            out.append(text)
+            continue
+
+        out.append(transition(current, wanted))
+        out.append(text)
+        current = wanted
+
+    out.append(transition(current, DEFAULT))
+    return ''.join(out)
@@ -4,18 +4,22 @@ Core function of `tcal` command
 
 from __future__ import print_function
 
-import re
 import sys
 
-from calendar import Calendar, SUNDAY, MONDAY
-from datetime import date
-from os.path import expanduser
-from sys import stdout, stderr
+from datetime import date, timedelta
+from functools import lru_cache
+from itertools import islice
+from os import environ
+from sys import stdout
+from time import perf_counter
 
-from . import CALRCS
-from .cli import parser
-from .render import TinyCalRenderer, Cell
+from . import CALRCS, SYSTEM_CALRC
+from . import cli
+from .render import TinyCalRenderer, Cell, Palette, Pager, BLANK
 from .config import TinyCalConfig, Color
+from .layout import layout, monthdatescalendar, strip
+
+MONDAY, SUNDAY = 0, 6
 
 weekday_codes = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
 
@@ -51,26 +55,379 @@ LANG = {
             },
         }
 
-date_mark_regex = re.compile(r'^(\d\d\d\d/\d\d/\d\d) +([\w:]+) *')
+
+def load_marks(path, start=None, end=None, categories=None):
+    r"""
+    Same as ``marks.load_marks()``, the date marking module is imported only when there are marks
+    """
+    from .marks import load_marks
+    return load_marks(path, start, end, categories)
 
 
 def calculate_month_range(before, after, year, month):
     r"""
     >>> calculate_month_range(1, 1, 2018, 1)
     [datetime.date(2017, 12, 1), datetime.date(2018, 1, 1), datetime.date(2018, 2, 1)]
+    >>> calculate_month_range(0, 25, 2018, 1)[-1]
+    datetime.date(2020, 2, 1)
+    """
+    base = year * 12 + month - 1
+    return [date(m // 12, m % 12 + 1, 1) for m in range(base - before, base + after + 1)]
+
+
+def month_range(start, end):
+    r"""
+    Return the leading dates of every month from ``start`` to ``end`` (inclusive)
+
+    >>> month_range(date(2019, 12, 25), date(2020, 2, 1))
+    [datetime.date(2019, 12, 1), datetime.date(2020, 1, 1), datetime.date(2020, 2, 1)]
+    """
+    months = (end.year - start.year) * 12 + (end.month - start.month)
+    return calculate_month_range(0, max(months, 0), start.year, start.month)
+
+
+@lru_cache(maxsize=None)
+def month_abbr_parts(lang):
+    r"""
+    Return the month abbreviations of ``lang`` split into parts, one part per calendar row
+
+    >>> month_abbr_parts('jp')[3]
+    ['彌生', '(３月)']
+    """
+    return [s.split() for s in (LANG[lang].get('month_abbr') or LANG[lang]['month'])]
+
+
+def disable_colors(conf):
+    r"""
+    Disable coloring of ``conf`` in-place
+    """
+    for k in conf.fields():
+        if k.startswith('color_'):
+            setattr(conf, k, Color(''))
+
+
+def cell_title(conf, leading_date, month_leading_dates, cont=False):
+    if cont and month_leading_dates[0] != month_leading_dates[-1]:
+        f, t = month_leading_dates[0], month_leading_dates[-1]
+        return '{}/{:02} ~ {}/{:02}'.format(f.year, f.month, t.year, t.month)
+
+    return '{m} {y}'.format(m=LANG[conf.lang]['month'][leading_date.month], y=leading_date.year)
+
+
+def load_engine(name):
+    r"""
+    Return the module of the color engine ``name``, or None for the pure Python engine
+
+    The NumPy engine falls back to the pure Python engine if NumPy is not importable.
+    """
+    if name == 'numpy':
+        try:
+            from . import vectorized
+            return vectorized
+        except ImportError:
+            pass
+
+    return None
+
+
+def cell_blocks(conf, month_leading_dates, today, cont=False, span=None):
+    r"""
+    Return the layout Blocks of the given months,
+    or the single Block of the days in ``span`` (first date, last date) in contiguous mode
+    """
+    firstweekday = MONDAY if conf.start_monday else SUNDAY
+    if span is not None:
+        return (strip(firstweekday, span[0], span[1], conf.wk_rule, today.year),)
+
+    return layout(firstweekday, month_leading_dates, cont, conf.wk_rule, today.year if cont else None)
+
+
+def iter_cells(conf, month_leading_dates, today=None, marks=None, cont=False, span=None):
+    r"""
+    Yield the cells of the given months, one Cell per month
+    (or a single Cell in contiguous mode)
+
+    If ``span`` (first date, last date) is given, the days in it are shown in a single Cell in contiguous mode,
+    ``month_leading_dates`` are the months it covers.
+
+    ``conf`` is not modified, colors are expected to be resolved by the caller.
+    The date layout is shared by all configs with the same ``start_monday`` and ``wk_rule``,
+    only the colors and language are applied here.
+    """
+    today = today or date.today()
+    date_marks = marks or {}
+    cont = cont or span is not None
+
+    firstweekday = MONDAY if conf.start_monday else SUNDAY
+    month_leading_dates = tuple(month_leading_dates)
+    blocks = cell_blocks(conf, month_leading_dates, today, cont, span)
+
+    if conf.color_today_wk is None:
+        # If today.wk.color is not configured, and wk.color.fg is configured
+        # Use a brighter version of wk.color for today.wk.color
+        if conf.color_wk.fg != None and conf.color_wk.bg == None:
+            color_today_wk = conf.color_wk.upper()
+        else:
+            color_today_wk = conf.color_wk
+    else:
+        color_today_wk = conf.color_today_wk
+
+    # Colors are calculated *outside* the renderer
+    # It's for contiguous mode
+    def colorize_weekday(idx):
+        color_name = 'color_weekday_%s' % weekday_codes[idx]
+        color = getattr(conf, color_name)
+        string = LANG[conf.lang]['weekday'][idx]
+        return color(string) + conf.color_weekday.code if color else string
+
+    weekday_title = conf.color_weekday(' '.join(map(colorize_weekday, ((firstweekday + i) % 7 for i in range(7)))))
+
+    wk_title = conf.color_wk(LANG[conf.lang]['weekday'][-1])
+
+    abbr_parts = month_abbr_parts(conf.lang)
+
+    # The cells refer to colors by palette indices
+    palette = Palette()
+    wk_color = palette.add(conf.color_wk)
+    today_wk_color = palette.add(color_today_wk)
+    today_color = palette.add(conf.color_today)
+
+    # Colors of the 7 columns
+    column_colors = [palette.add(getattr(conf, 'color_%s' % weekday_codes[(firstweekday + i) % 7])) for i in range(7)]
+    fill_color = palette.add(conf.color_fill) if conf.fill else BLANK
+
+    today_ordinal = today.toordinal()
+    mark_ordinals = {day.toordinal(): palette.add(c) for day, c in date_marks.items()}
+
+    # Colors of the rows without today and marks, keyed by in_range
+    row_colors = {}
+
+    def colorize_days(week):
+        row = week.row
+        try:
+            colors = row_colors[row.in_range]
+        except KeyError:
+            colors = row_colors[row.in_range] = bytes(
+                    c if in_range else fill_color for c, in_range in zip(column_colors, row.in_range))
+
+        # Today and marks are overlays on the columns
+        overlay = (0 <= today_ordinal - week.first < 7 and row.in_range[today_ordinal - week.first]) or \
+                (mark_ordinals and any(week.first + i in mark_ordinals for i in range(7)))
+
+        if not overlay:
+            return colors
+
+        colors = bytearray(colors)
+        for i, in_range in enumerate(row.in_range):
+            ordinal = week.first + i
+            if not in_range:
+                continue
+            elif ordinal == today_ordinal:
+                colors[i] = today_color
+            elif ordinal in mark_ordinals:
+                colors[i] = mark_ordinals[ordinal]
+
+        return colors
+
+    def get_month_abbr(abbr):
+        if abbr is None:
+            return ''
+
+        parts = abbr_parts[abbr[0]]
+        return parts[abbr[1]] if abbr[1] < len(parts) else ''
+
+    def week_colors(weeks):
+        colors = bytearray()
+        for week in weeks:
+            # Highlight current week
+            wk_contain_today = 0 <= today_ordinal - week.first < 7 and \
+                    week.row.in_range[today_ordinal - week.first]
+
+            colors.append(today_wk_color if wk_contain_today else wk_color)
+            colors += colorize_days(week)
+
+        return colors
+
+    def block_colors(blocks):
+        engine = load_engine(conf.engine)
+        if engine is None:
+            for block in blocks:
+                yield block, week_colors(block.weeks)
+            return
+
+        # The colors of a year of weeks at once, the blocks are still consumed lazily
+        blocks = iter(blocks)
+        while True:
+            chunk = list(islice(blocks, 12))
+            if not chunk:
+                return
+
+            matrix = engine.week_colors([week for block in chunk for week in block.weeks],
+                                        column_colors, fill_color, wk_color, today_wk_color,
+                                        today_ordinal, today_color, mark_ordinals)
+            offset = 0
+            for block in chunk:
+                yield block, matrix[offset:offset + len(block.weeks)].tobytes()
+                offset += len(block.weeks)
+
+    for block, colors in block_colors(blocks):
+        ld = block.leading_date
+        cell = Cell(conf, palette)
+        cell.title = cell_title(conf, ld, month_leading_dates, cont)
+
+        cell.weekday_title = weekday_title
+        cell.wk_title = wk_title
+
+        months = [get_month_abbr(week.abbr) for week in block.weeks] if cont else None
+        cell.set_weeks(block.weeks, colors, months)
+        yield cell
+
+
+def build_cells(conf, month_leading_dates, today=None, marks=None, cont=False):
+    r"""
+    Build the cell grid of the given months, one Cell per month
+    (or a single Cell in contiguous mode)
+
+    ``conf`` is not modified, colors are expected to be resolved by the caller.
+    """
+    return list(iter_cells(conf, month_leading_dates, today=today, marks=marks, cont=cont))
+
+
+def render_lines(conf, start, end=None, today=None, marks=None, cont=False):
+    r"""
+    Yield the rendered lines of the months from ``start`` to ``end``
+
+    The cells are built lazily, so the first lines are available before the whole range is processed.
+    """
+    cells = iter_cells(conf, month_range(start, end or start), today=today, marks=marks, cont=cont)
+    return TinyCalRenderer(conf, cells).render_lines()
+
+
+def year_blocks(start, end):
+    r"""
+    Split the months from ``start`` to ``end`` by year, return the leading dates of every year block
+
+    >>> [(b[0].isoformat(), len(b)) for b in year_blocks(date(2019, 11, 1), date(2020, 2, 1))]
+    [('2019-11-01', 2), ('2020-01-01', 2)]
+    """
+    return [month_range(max(start, date(year, 1, 1)), min(end, date(year, 12, 1)))
+            for year in range(start.year, end.year + 1)]
+
+
+def iter_grid(conf, month_leading_dates, today=None, marks=None, cont=False, span=None):
+    r"""
+    Yield the logical grid of the given months, one dict per cell (like ``iter_cells()``),
+    without colorizing, padding and borders
+
+    Every day has its date, day number and whether it's a filled day (not in the displayed months),
+    today and marked days have their colors.
+    """
+    today = today or date.today()
+    date_marks = marks or {}
+    cont = cont or span is not None
+
+    month_leading_dates = tuple(month_leading_dates)
+    blocks = cell_blocks(conf, month_leading_dates, today, cont, span)
+
+    today_ordinal = today.toordinal()
+    mark_ordinals = {day.toordinal(): c for day, c in date_marks.items()}
+
+    for block in blocks:
+        ld = block.leading_date
+        cell = {'title': cell_title(conf, ld, month_leading_dates, cont)}
+        if span is not None:
+            cell['from'], cell['to'] = span[0].isoformat(), span[1].isoformat()
+        elif cont:
+            cell['from'] = '{:04}-{:02}'.format(month_leading_dates[0].year, month_leading_dates[0].month)
+            cell['to'] = '{:04}-{:02}'.format(month_leading_dates[-1].year, month_leading_dates[-1].month)
+        else:
+            cell['year'], cell['month'] = ld.year, ld.month
+
+        weeks = cell['weeks'] = []
+        for week in block.weeks:
+            days = []
+            for i, (day, in_range) in enumerate(zip(week.row.days, week.row.in_range)):
+                ordinal = week.first + i
+                d = {'date': date.fromordinal(ordinal).isoformat(), 'day': day, 'fill': not in_range}
+                if in_range and ordinal == today_ordinal:
+                    d['today'] = True
+                    d['color'] = str(conf.color_today)
+                elif in_range and ordinal in mark_ordinals:
+                    d['color'] = str(mark_ordinals[ordinal])
+
+                days.append(d)
+
+            weeks.append({'wk': week.wk, 'days': days})
+
+        yield cell
+
+
+def render_json_lines(conf, blocks, today=None, marks=None, cont=False, span=None):
+    r"""
+    Yield a JSON document of the grid of the month blocks (see ``iter_grid()``), one cell per line
+    """
+    import json
+
+    today = today or date.today()
+    yield '{{"today": "{}", "start_monday": {}, "wk_rule": {}, "lang": {}, "cells": ['.format(
+            today.isoformat(), json.dumps(bool(conf.start_monday)), json.dumps(conf.wk_rule), json.dumps(conf.lang))
+
+    prev = None
+    for months in blocks:
+        for cell in iter_grid(conf, months, today=today, marks=marks, cont=cont, span=span):
+            if prev is not None:
+                yield prev + ','
+
+            prev = json.dumps(cell, ensure_ascii=False)
+
+    if prev is not None:
+        yield prev
+
+    yield ']}'
+
+
+def render_year_blocks(conf, start, end, today=None, marks=None, cont=False, pager=None):
+    r"""
+    Yield the rows (lists of lines) of the months from ``start`` to ``end``, one year block at a time
+
+    Year blocks are separated by an empty line, which is dropped at a page break.
     """
-    return [date(year - (month <= i), (month - 1 - i) % 12 + 1, 1) for i in range(before, 0, -1)] + \
-           [date(year, month, 1)] + \
-           [date(year + (month + i > 12), (month - 1 + i) % 12 + 1, 1) for i in range(1, after+1)]
+    for idx, months in enumerate(year_blocks(start, end)):
+        if idx:
+            if pager is None:
+                yield ['']
+            elif pager.fits(1):
+                pager.add(1)
+                yield ['']
 
+        cells = iter_cells(conf, months, today=today, marks=marks, cont=cont)
+        for lines in TinyCalRenderer(conf, cells).render_rows(pager):
+            yield lines
 
-def calculate_week_of_the_year(first_date_of_year, target_date):
-    return (target_date - first_date_of_year).days // 7 + 1
+
+def render(conf, start, end=None, today=None, marks=None, cont=False):
+    r"""
+    Render the months from ``start`` to ``end`` into a string
+
+    ``start`` and ``end`` are dates, only their year and month are used.
+    ``marks`` is a ``{date: Color}`` dict, like the one returned by ``load_marks()``.
+    """
+    return '\n'.join(render_lines(conf, start, end, today=today, marks=marks, cont=cont))
 
 
-def main():
-    conf = TinyCalConfig.parse_conf(CALRCS)
-    args = parser.parse_args()
+def parse_args(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv:
+        args = cli.parser.parse_args(argv)
+        if isinstance(args.year, tuple) and args.month is not None:
+            cli.parser.error('month cannot be specified with a range')
+        if isinstance(args.year, cli.DateSpan) and args.weeks:
+            cli.parser.error('--weeks cannot be specified with a date range')
+    else:
+        # Fast path, skip building the argument parser
+        args = cli.default_args()
 
     border_args = args.border
     args.border = None
@@ -84,179 +441,175 @@ def main():
         elif i in ('weld', 'noweld'):
             args.border_weld = (i == 'weld')
 
-    # Merge args and conf in-place into conf
-    for k in vars(conf):
-        if k in vars(args) and getattr(args, k) is not None:
-            setattr(conf, k , getattr(args, k))
+    return args
 
-    if conf.border == 'true':
-        conf.border = 'full'
-    elif conf.border == 'false':
-        conf.border = 'off'
 
-    if conf.color_today_wk == TinyCalConfig.color_today_wk.default:
-        # If today.wk.color is not configured, and wk.color.fg is configured
-        # Re-assign today.wk.color to a brighter version of wk.color
-        if conf.color_wk.fg != None and conf.color_wk.bg == None:
-            conf.color_today_wk = conf.color_wk.upper()
-        else:
-            conf.color_today_wk = conf.color_wk
-
-    date_marks = {}
-    if (args.color == 'never') or (args.color == 'auto' and not stdout.isatty()):
-        # Disable coloring
-        for k in vars(conf):
-            if k.startswith('color_'):
-                setattr(conf, k, Color(''))
-
-    elif conf.marks:
-        # Read date marking file
-        try:
-            with open(expanduser(conf.marks)) as marks_file:
-                for line in marks_file:
-                    m = date_mark_regex.match(line.strip())
-                    if not m:
-                        # Silently ignore invalid lines
-                        continue
+def run(conf, args, isatty, marks_loader=load_marks):
+    r"""
+    Yield the rendered lines, with ``conf`` overridden by the parsed arguments (``conf`` is not modified)
+    """
+    overrides = {k: getattr(args, k) for k in conf.fields() if getattr(args, k, None) is not None}
 
-                    mark_date, mark_color = date(*map(int, m.group(1).split('/'))), m.group(2)
-                    try:
-                        date_marks[mark_date] = Color(mark_color)
-                    except ValueError:
-                        pass
+    border = overrides.get('border', conf.border)
+    if border == 'true':
+        overrides['border'] = 'full'
+    elif border == 'false':
+        overrides['border'] = 'off'
 
-        except FileNotFoundError:
-            print('Warning: Mark file "{}" does not exist'.format(conf.marks), file=stderr)
+    # Colors are data in JSON format, not escape sequences
+    colorless = args.format != 'json' and (args.color == 'never' or (args.color == 'auto' and not isatty))
+    if colorless:
+        overrides.update((k, Color('')) for k in conf.fields() if k.startswith('color_'))
 
-    calendar = Calendar(MONDAY if conf.start_monday else SUNDAY)
-    monthdates = calendar.monthdatescalendar
+    conf = conf.replace(**overrides)
 
     today = args.today if args.today else date.today()
-    today_wk = calculate_week_of_the_year(monthdates(today.year, 1)[0][0], today)
 
     # Calculate display range (from which month to which month)
-    if args.year is not None and args.month is None:
-        month_leading_dates = [date(args.year, month, 1) for month in range(1, 13)]
+    span = None
+    if isinstance(args.year, cli.DateSpan):
+        span = args.year
+    elif args.weeks:
+        if isinstance(args.year, tuple):
+            anchor = args.year[0]
+        else:
+            # The month is normalized like the other ranges, e.g. 2020 13 is 2021/01
+            anchor = today if args.year is None else calculate_month_range(0, 0, args.year, args.month or 1)[0]
+
+        first = anchor - timedelta(days=(anchor.weekday() - (MONDAY if conf.start_monday else SUNDAY)) % 7)
+        span = cli.DateSpan(first, first + timedelta(days=7 * args.weeks - 1))
+
+    if span is not None:
+        start, end = span.first.replace(day=1), span.last.replace(day=1)
+    elif isinstance(args.year, tuple):
+        start, end = args.year
+    elif args.year is not None and args.month is None:
+        start, end = date(args.year, 1, 1), date(args.year, 12, 1)
     else:
         year = args.year or today.year
         month = args.month or today.month
         before, after = (1, 1) if args.a1b1 else (conf.before, conf.after)
         month_leading_dates = calculate_month_range(before, after, year, month)
+        start, end = month_leading_dates[0], month_leading_dates[-1]
 
-    # Create TinyCalRenderer object for rendering
-    renderer = TinyCalRenderer(conf)
+    if args.format == 'json':
+        date_marks = marks_loader(conf.marks, start, end, conf.marks_categories) if conf.marks else {}
+        blocks = year_blocks(start, end) if span is None and isinstance(args.year, tuple) else [month_range(start, end)]
+        return render_json_lines(conf, blocks, today=today, marks=date_marks, cont=args.cont, span=span)
 
-    # Colors are calculated *outside* the renderer
-    # It's for contiguous mode
-    def colorize_weekday(idx):
-        color_name = 'color_weekday_%s' % weekday_codes[idx]
-        color = getattr(conf, color_name)
-        string = LANG[conf.lang]['weekday'][idx]
-        return color(string) + conf.color_weekday.code if color else string
+    date_marks = {}
+    if colorless:
+        if args.marks:
+            # Not loaded, which would close it
+            args.marks.close()
 
-    weekday_title = conf.color_weekday(' '.join(map(colorize_weekday, calendar.iterweekdays())))
+    elif conf.marks:
+        date_marks = marks_loader(conf.marks, start, end, conf.marks_categories)
 
-    def colorize_wk(wk, contain_today=False):
-        if isinstance(wk, int):
-            if contain_today:
-                c = conf.color_today_wk
-            else:
-                c = conf.color_wk
+    pager = Pager(args.page_rows) if args.page_rows else None
+    if span is None and isinstance(args.year, tuple):
+        rows = render_year_blocks(conf, start, end, today=today, marks=date_marks, cont=args.cont, pager=pager)
+    else:
+        cells = iter_cells(conf, month_range(start, end), today=today, marks=date_marks, cont=args.cont, span=span)
+        rows = TinyCalRenderer(conf, cells).render_rows(pager)
 
-            return c('{:>2}'.format(wk))
+    lines = (line for lines in rows for line in lines)
+    if conf.sgr_coalesce:
+        from .sgr import coalesce
+        lines = map(coalesce, lines)
 
-        return conf.color_wk(wk)
+    return lines
 
-    wk_title = colorize_wk(LANG[conf.lang]['weekday'][-1])
 
-    month_range = [ld.month for ld in month_leading_dates]
+def config_sources():
+    r"""
+    Return the configuration sources, the preferred ones first
+    """
+    return list(CALRCS) + [SYSTEM_CALRC]
 
-    month_abbr = {}
-    for m in range(1, 13):
-        month_abbr[m] = (LANG[conf.lang].get('month_abbr') or LANG[conf.lang]['month'])[m].split() + [''] * 5
 
-    def colorize_day(day):
-        if (not args.cont and day.month != ld.month) or (args.cont and day.month not in month_range):
-            c = (conf.color_fill) if (conf.fill) else (lambda s: '  ')
-        else:
-            if day == today:
-                c = conf.color_today
-            elif day in date_marks:
-                c = date_marks[day]
-            else:
-                c = getattr(conf, 'color_%s' % weekday_codes[day.weekday()])
+def main(argv=None, cache=None):
+    started = perf_counter()
+    args = parse_args(argv)
 
-        return c('{:>2}'.format(day.day))
+    if args.serve is not None:
+        from .server import serve
+        serve(args.serve or None)
+        return
 
-    def get_month_abbr(month):
-        if month not in month_range:
-            return ''
-        else:
-            return month_abbr[month].pop(0)
+    if args.cache_stats:
+        from .cache import RenderCache
+        cache = cache or RenderCache.from_env()
+        print(cache.report() if cache else 'cache: disabled, set TINYCAL_CACHE to enable')
+        return
 
+    if args.watch:
+        from .watch import Watcher
+        Watcher(args, isatty=stdout.isatty()).run()
+        return
 
-    if args.cont:
-        # For contiguous mode, only 1 Cell obj needed
-        cells = [Cell(conf)]
-        f = month_leading_dates[0]
-        t = month_leading_dates[-1]
-        if f == t:
-            cells[0].title = '{m} {y}'.format(m=LANG[conf.lang]['month'][f.month], y=f.year)
-            def get_month_abbr(month):
-                return ''
+    profile = target = None
+    if args.profile is not None or environ.get('TINYCAL_PROFILE'):
+        from .profile import Profile, target_from_env
+        target = args.profile or target_from_env()
+        if target:
+            profile = Profile()
+            profile.started = started
+            profile.add('argparse', perf_counter() - started)
 
-        else:
-            cells[0].title = '{}/{:02} ~ {}/{:02}'.format(f.year, f.month, t.year, t.month)
+    if profile is None:
+        return output(args, argv, cache)
 
-        cells[0].weekday_title = weekday_title
-        cells[0].wk_title = wk_title
+    with profile:
+        output(args, argv, cache, profile)
 
-    else:
-        # For non-contiguous mode, every month has its own Cell obj
-        cells = []
-        for ld in month_leading_dates:
-            cell = Cell(conf)
-            cell.title = '{m} {y}'.format(m=LANG[conf.lang]['month'][ld.month], y=ld.year)
-            cell.weekday_title = weekday_title
-            cell.wk_title = wk_title
-            cells.append(cell)
-
-        def get_month_abbr(month):
-            return ''
+    profile.emit(target, argv=sys.argv[1:] if argv is None else list(argv))
 
-    # Put the days into cells, and cells into renderer
-    last_cell = None
-    last_week_leading_date = None
-    for ld in month_leading_dates:
-        for week in monthdates(ld.year, ld.month):
-            # calculate week number
-            if args.cont and ld.month != week[-1].month and ld.year != today.year:
-                # Edge case, sometimes wk53 needs to be changed to wk01
-                wk = calculate_week_of_the_year(monthdates(week[-1].year, 1)[0][-1], week[-1])
-            else:
-                # Normal case
-                wk = calculate_week_of_the_year(monthdates(ld.year, 1)[0][0], week[0])
 
-            # Highlight current week
-            if (not args.cont and today.month != ld.month) or (args.cont and today.month not in month_range):
-                wk_contain_today = False
-            else:
-                wk_contain_today = today in week
-
-            # Dont append days into the same cell twice (ok for different cell)
-            if (last_cell, last_week_leading_date) != (cells[0], week[0]):
-                cells[0].append(
-                        wk=colorize_wk(wk, contain_today=wk_contain_today),
-                        days=' '.join([colorize_day(day) for day in week]),
-                        month=get_month_abbr(week[-1].month),
-                        )
-                last_week_leading_date = week[0]
-                last_cell = cells[0]
-
-        if len(cells) > 1:
-            renderer.append(cells.pop(0))
-
-    assert len(cells) == 1
-    renderer.append(cells[0])
-
-    print(renderer.render())
+def output(args, argv, cache=None, profile=None):
+    r"""
+    Render and print the calendar of parsed arguments,
+    the durations and counters are recorded into ``profile`` if specified
+    """
+    calrcs = config_sources()
+    marks_loader = load_marks
+    if profile is None:
+        conf = TinyCalConfig.load(calrcs, environ)
+    else:
+        conf = profile.phase('config', TinyCalConfig.load, calrcs, environ)
+        marks_loader = lambda *a: profile.phase('marks', load_marks, *a)
+
+    isatty = stdout.isatty()
+    if cache is not None and not all(isinstance(rc, str) for rc in calrcs):
+        cache = None
+
+    lines = run(conf, args, isatty, marks_loader)
+    write = sys.stdout.write
+    if profile is not None:
+        lines = profile.iterate('render', lines)
+
+        def write(s, write=write):
+            t = perf_counter()
+            write(s)
+            profile.add('write', perf_counter() - t)
+            profile.count('lines')
+            profile.count('bytes', len(s.encode('utf-8')))
+
+    # Stream the lines, so long ranges start printing immediately
+    buf = [] if cache is not None else None
+    try:
+        for line in lines:
+            write(line + '\n')
+            if buf is not None:
+                buf.append(line + '\n')
+
+    except BrokenPipeError:
+        # Output is closed (e.g. piped into `head`), exit quietly
+        import os
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+
+    if cache is not None:
+        marks = getattr(args.marks, 'name', None) or conf.marks
+        cache.put(cache.key(sys.argv[1:] if argv is None else argv, isatty),
+                  ''.join(buf), deps=calrcs + ([marks] if marks else []))
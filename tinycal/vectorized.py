@@ -0,0 +1,50 @@
+"""
+NumPy engine of the cell colors
+
+Enabled by ``engine = numpy`` (or ``TINYCAL_ENGINE=numpy``) if NumPy is importable,
+the pure Python engine is used otherwise, and the output is identical.
+
+The layout (day numbers, filled days, week numbers) is template based and shared,
+the per-day work of a render is deciding the color of every day:
+the columns, filled days, today and the marks.
+Here the palette indices of every day of a year of months are computed at once, as a matrix,
+instead of one day at a time.
+"""
+
+import numpy as np
+
+
+def week_colors(weeks, column_colors, fill_color, wk_color, today_wk_color, today_ordinal, today_color,
+                mark_ordinals):
+    r"""
+    Return the palette indices of ``weeks``, an (n, 8) uint8 matrix, the week number and the 7 days of every week
+
+    ``mark_ordinals`` is a ``{date ordinal: palette index}`` dict.
+    The indices are the same as the ones of the pure Python engine in ``tcal.iter_cells()``.
+    """
+    if not weeks:
+        return np.zeros((0, 8), dtype=np.uint8)
+
+    # Rows are shared by the weeks, convert each of them once
+    rows = {}
+    row_ids = np.fromiter((rows.setdefault(week.row, len(rows)) for week in weeks), dtype=np.intp, count=len(weeks))
+    in_range = np.array([row.in_range for row in rows], dtype=bool)[row_ids]
+
+    firsts = np.fromiter((week.first for week in weeks), dtype=np.int64, count=len(weeks))
+    ordinals = firsts[:, None] + np.arange(7)
+
+    colors = np.where(in_range, np.asarray(column_colors, dtype=np.uint8), np.uint8(fill_color))
+
+    if mark_ordinals:
+        keys = np.fromiter(sorted(mark_ordinals), dtype=np.int64, count=len(mark_ordinals))
+        values = np.array([mark_ordinals[k] for k in keys.tolist()], dtype=np.uint8)
+        pos = np.searchsorted(keys, ordinals).clip(max=len(keys) - 1)
+        marked = in_range & (keys[pos] == ordinals)
+        colors[marked] = values[pos[marked]]
+
+    # Today overrides the marks
+    is_today = in_range & (ordinals == today_ordinal)
+    colors[is_today] = today_color
+
+    wk = np.where(is_today.any(axis=1), today_wk_color, wk_color).astype(np.uint8)
+    return np.column_stack((wk, colors))
@@ -0,0 +1,119 @@
+"""
+Resident watch mode of `tcal --watch`
+
+The calendar is rendered again at local midnight,
+or when the configuration files or the date marking file change,
+and only the changed lines are repainted, with cursor addressing instead of clearing the screen.
+"""
+
+import os
+import sys
+import time
+
+from datetime import date, datetime, timedelta
+from os.path import expanduser
+
+from . import tcal
+from .config import TinyCalConfig, file_stamp
+
+CSI = '\033['
+
+
+def repaint(old, new):
+    r"""
+    Return the escape sequences that turn the screen lines ``old`` into ``new``
+
+    >>> repaint(['a', 'b', 'c'], ['a', 'x'])
+    '\x1b[2;1Hx\x1b[K\x1b[3;1H\x1b[K'
+    >>> repaint(['a'], ['a'])
+    ''
+    """
+    out = []
+    for idx, line in enumerate(new):
+        if idx >= len(old) or old[idx] != line:
+            out.append('{}{};1H{}{}K'.format(CSI, idx + 1, line, CSI))
+
+    for idx in range(len(new), len(old)):
+        out.append('{}{};1H{}K'.format(CSI, idx + 1, CSI))
+
+    return ''.join(out)
+
+
+def seconds_to_midnight(now=None):
+    r"""
+    >>> seconds_to_midnight(datetime(2020, 3, 14, 23, 59, 30))
+    30.0
+    """
+    now = now or datetime.now()
+    return (datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+
+
+class Watcher:
+    def __init__(self, args, calrcs=None, isatty=True):
+        self.args = args
+        self.calrcs = calrcs
+        self.isatty = isatty
+        self.lines = None
+        self.stamp = None
+        self.deps = []
+
+        # The date marking file is read again on every render
+        if args.marks is not None and hasattr(args.marks, 'name'):
+            args.marks.close()
+            args.marks = args.marks.name
+
+    def current_stamp(self):
+        return (self.args.today or date.today(), tuple(file_stamp(expanduser(path)) for path in self.deps))
+
+    def render(self):
+        r"""
+        Read the files and render, return the stamp before reading and the lines
+        """
+        calrcs = tcal.config_sources() if self.calrcs is None else self.calrcs
+        conf = TinyCalConfig.load(calrcs, os.environ)
+
+        marks = self.args.marks or conf.marks
+        self.deps = [rc for rc in calrcs if isinstance(rc, str)] + ([marks] if isinstance(marks, str) else [])
+
+        # A change during the render is caught by the next step
+        stamp = self.current_stamp()
+        return stamp, list(tcal.run(conf, self.args, self.isatty))
+
+    def step(self):
+        r"""
+        Render again if the date or any file changed, return the escape sequences to repaint the screen
+        """
+        if self.current_stamp() == self.stamp:
+            return ''
+
+        self.stamp, lines = self.render()
+
+        if self.lines is None:
+            out = CSI + 'H' + CSI + '2J' + repaint([], lines)
+        else:
+            out = repaint(self.lines, lines)
+
+        self.lines = lines
+        return out
+
+    def run(self, interval=1.0):
+        write, flush = sys.stdout.write, sys.stdout.flush
+
+        # Hide cursor
+        write(CSI + '?25l')
+        try:
+            while True:
+                out = self.step()
+                if out:
+                    write(out)
+                    flush()
+
+                time.sleep(min(interval, seconds_to_midnight() + 0.01))
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            # Leave the cursor below the calendar
+            write('{}{};1H{}?25h'.format(CSI, len(self.lines or []) + 1, CSI))
+            flush()
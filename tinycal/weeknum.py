@@ -0,0 +1,94 @@
+"""
+Week numbering
+
+Week numbers are calculated from date ordinals,
+the first day of week 1 of every year is calculated only once.
+
+Rules:
+
+- ``jan1``: the week containing January 1st is week 1, weeks start on the displayed first weekday
+- ``us``: the week containing January 1st is week 1, weeks start on Sunday
+- ``iso``: ISO-8601, weeks start on Monday, the week containing January 4th is week 1
+- ``full``: the first full week is week 1, the days before it are in week 0
+"""
+
+from datetime import date
+
+MONDAY, SUNDAY = 0, 6
+
+RULES = ('jan1', 'us', 'iso', 'full')
+
+_anchors = {}
+
+
+def week_one(rule, firstweekday, year):
+    r"""
+    Return the ordinal of the first day of week 1 of the year
+
+    >>> date.fromordinal(week_one('jan1', SUNDAY, 2020))
+    datetime.date(2019, 12, 29)
+    >>> date.fromordinal(week_one('full', SUNDAY, 2020))
+    datetime.date(2020, 1, 5)
+    """
+    key = (rule, firstweekday, year)
+    try:
+        return _anchors[key]
+    except KeyError:
+        pass
+
+    jan1 = date(year, 1, 1)
+    if rule == 'full':
+        anchor = jan1.toordinal() + (firstweekday - jan1.weekday()) % 7
+    else:
+        anchor = jan1.toordinal() - (jan1.weekday() - firstweekday) % 7
+
+    _anchors[key] = anchor
+    return anchor
+
+
+class WeekNumbering:
+    r"""
+    Calculate week numbers of calendar rows
+
+    >>> wn = WeekNumbering('jan1', SUNDAY)
+    >>> wn(date(2020, 3, 8))
+    11
+    >>> wn(date(2019, 12, 29)), wn(date(2019, 12, 29), year=2019)
+    (1, 53)
+    >>> WeekNumbering('iso', SUNDAY)(date(2019, 12, 29))
+    1
+    >>> WeekNumbering('full', MONDAY)(date(2019, 12, 30), year=2020)
+    0
+    """
+    def __init__(self, rule, firstweekday):
+        if rule not in RULES:
+            raise ValueError('unknown week numbering rule: {}'.format(rule))
+
+        self.rule = rule
+        self.firstweekday = firstweekday
+        if rule == 'us':
+            self.weekday = SUNDAY
+        elif rule == 'iso':
+            self.weekday = MONDAY
+        else:
+            self.weekday = firstweekday
+
+        # Offset from the first date of a row to the date that represents the row
+        self.offset = (MONDAY - firstweekday) % 7 if rule == 'iso' else 0
+
+    def __call__(self, first_date, year=None):
+        r"""
+        Return the week number of the row starts from ``first_date``
+
+        ``year`` selects which year the week number belongs to,
+        it matters to the rows across two years,
+        default to the year after the end of the row.
+        """
+        ordinal = first_date.toordinal() + self.offset
+        if self.rule == 'iso':
+            return date.fromordinal(ordinal).isocalendar()[1]
+
+        if year is None:
+            year = date.fromordinal(first_date.toordinal() + 6).year
+
+        return (ordinal - week_one(self.rule, self.weekday, year)) // 7 + 1